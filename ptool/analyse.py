@@ -1,87 +1,659 @@
 import os
+import sys
+import hashlib
 import itertools
+import statistics
+import tempfile
 import pandas as pd
 import numpy as np
 import humanize
+import pyarrow as pa
+import pyarrow.compute as pc
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pyarrow import csv as pacsv
+from .filters import Filter
 
 __all__ = [
+    "read_table",
     "read_csv",
+    "add_paths",
+    "parse_checksums",
+    "add_checksums",
+    "apply_filter",
     "compare",
     "compare_compact",
     "compare_directory_view",
     "summary",
+    "estimate",
     "merge",
+    "merge_names",
     "directory_map",
+    "hardlinks",
 ]
 
 
-def read_csv(filename, ignore=None, drop_duplicates=False):
+def site_name(filename):
+    "site label derived from checksum filename (compression extension dropped)"
+    name = os.path.basename(filename)
+    for ext in (".gz", ".zst"):
+        name = name.removesuffix(ext)
+    return os.path.splitext(name)[0]
+
+
+def _subtree_mask(fpath, subtree, prefix=""):
+    """selects paths below `subtree` (absolute, or relative at any depth)
+
+    A relative `subtree` is only matched below `prefix`, i.e., in the part
+    of the path that ends up in `rparent`."""
+    subtree = os.path.normpath(subtree).rstrip(os.path.sep)
+    if os.path.isabs(subtree) or not subtree:
+        return pc.starts_with(fpath, subtree + os.path.sep)
+    if prefix.rstrip(os.path.sep):
+        fpath = pc.utf8_slice_codeunits(fpath, len(prefix.rstrip(os.path.sep)))
+    return pc.match_substring(fpath, os.path.sep + subtree + os.path.sep)
+
+
+def _path_range(fpath, bounds=None):
+    "lowest and highest path of `fpath` and of the previous `bounds`"
+    lo, hi = pc.min_max(fpath).values()
+    if not lo.is_valid:
+        return bounds
+    lo, hi = lo.as_py(), hi.as_py()
+    if bounds is not None:
+        lo, hi = min(lo, bounds[0]), max(hi, bounds[1])
+    return lo, hi
+
+
+def read_table(filename, subtree=None):
+    """Reads checksum file as pyarrow Table.
+
+    Files compressed with gzip (.gz) or zstd (.zst) are decompressed on the
+    fly and parsed using multiple threads.
+
+    With `subtree`, the file is streamed in blocks and only files below the
+    given directory are kept, so memory usage depends on the size of the
+    sub-tree rather than on the size of the pool. An absolute path selects
+    files by prefix, a relative path (e.g., `exp1/outdata`) selects files
+    below directories of that name at any depth below the common prefix of
+    all files (see `compact_paths`), so it selects the same files at sites
+    with different prefixes."""
+    filename = os.path.expanduser(filename)
+    read_options = pacsv.ReadOptions(use_threads=True)
+    # "dev:ino" could otherwise be mistaken for a time of day
+    convert_options = pacsv.ConvertOptions(
+        column_types={"checksum": pa.string(), "inode": pa.string()}
+    )
+    if not subtree:
+        return pacsv.read_csv(
+            filename, read_options=read_options, convert_options=convert_options
+        )
+    read_options.block_size = 1 << 24
+    reader = pacsv.open_csv(
+        filename, read_options=read_options, convert_options=convert_options
+    )
+    # older checksum files name the path column `fname`
+    column = "fpath" if "fpath" in reader.schema.names else "fname"
+    batches = []
+    bounds = None
+    for batch in reader:
+        bounds = _path_range(batch.column(column), bounds)
+        batches.append(batch.filter(_subtree_mask(batch.column(column), subtree)))
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    if table.num_rows:
+        # the common prefix is only known once all paths are seen
+        prefix = os.path.commonpath([os.path.dirname(path) for path in bounds])
+        table = table.filter(_subtree_mask(table[column], subtree, prefix))
+    if not table.num_rows:
+        raise ValueError(f"no files below {subtree} in {filename}")
+    return table
+
+
+REPORT_MEMORY = False
+# rows of the join on file name beyond which common names are matched
+# only within associated directories (see `merge_names`)
+MAX_NAME_JOIN = 10_000_000
+# checksums are stored as a pair of unsigned 64-bit integers
+KEY = ["key_hi", "key_lo"]
+KEY_WIDTH = 32  # hex digits
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_HEX_VALUES = np.zeros(256, dtype=np.uint8)
+_HEX_VALUES[_HEX_DIGITS] = np.arange(16)
+_HEX_VALUES[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
+
+def report_memory(stage, df):
+    "prints memory footprint of a frame at a given stage (if enabled)"
+    if REPORT_MEMORY:
+        nbytes = df.memory_usage(deep=True).sum()
+        print(
+            f"{stage}: {df.shape[0]} rows, {humanize.naturalsize(nbytes)}",
+            file=sys.stderr,
+        )
+
+
+def compact_paths(df):
+    """Replaces `fpath` column by `fname` and `rparent` columns.
+
+    `rparent` is categorical, i.e., each directory is stored only once. The
+    common prefix is returned separately instead of being repeated on each
+    row. Use `add_paths` to derive `rpath` and `fpath` for rendering.
+    """
+    parts = df.fpath.str.rpartition(os.path.sep)
+    parents = pd.Categorical(parts[0])
+    prefix = os.path.commonpath(list(parents.categories))
+    rparents = parents.categories.str.removeprefix(prefix)
+    rparents = rparents.where(rparents != "", os.path.sep)
+    df = df.drop(columns="fpath")
+    df["fname"] = parts[2]
+    df["rparent"] = parents.rename_categories(rparents)
+    return df, prefix
+
+
+def add_paths(df, prefix, suffix=""):
+    """Derives `rpath` and `fpath` columns from `rparent` and `fname` columns.
+
+    `suffix` selects the side of compare results (i.e., "_left" or "_right").
+    """
+    rparent = df[f"rparent{suffix}"].astype("string")
+    fname = df[f"fname{suffix}"].astype("string")
+    rpath = rparent.str.rstrip(os.path.sep) + os.path.sep + fname
+    return df.assign(**{f"rpath{suffix}": rpath, f"fpath{suffix}": prefix + rpath})
+
+
+def parse_checksums(checksum):
+    """Parses `algorithm:hexdigest` checksums into fixed-width binary keys.
+
+    Returns the algorithm tag and a frame with `key_hi` and `key_lo` columns
+    (uint64) holding the digest. Digests shorter than 128 bits are zero
+    padded. Mixing algorithms in a single checksum file is not supported.
+    """
+    if checksum.empty:
+        keys = np.zeros((0, len(KEY)), dtype=np.uint64)
+        return "", pd.DataFrame(keys, columns=KEY, index=checksum.index)
+    parts = checksum.str.partition(":")
+    algorithms = parts[0].unique()
+    if len(algorithms) > 1:
+        raise ValueError(f"mixed checksum algorithms: {list(algorithms)}")
+    algorithm = algorithms[0] if len(algorithms) else ""
+    digests = parts[2].str.zfill(KEY_WIDTH)
+    if len(digests) and digests.str.len().max() > KEY_WIDTH:
+        raise ValueError(f"checksum digests longer than {KEY_WIDTH} hex digits")
+    chars = np.array(digests, dtype=f"S{KEY_WIDTH}").view(np.uint8)
+    nibbles = _HEX_VALUES[chars.reshape(-1, KEY_WIDTH)]
+    octets = (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+    keys = octets.view(">u8").astype(np.uint64)
+    keys = pd.DataFrame(keys, columns=KEY, index=checksum.index)
+    return algorithm, keys
+
+
+def unhashed_keys(fpath, salt):
+    """Synthetic keys for files recorded without checksum ("-").
+
+    Both keys are hashes of the path salted with `salt` (e.g., checksum
+    filename), so these files never match any file of another checksum file
+    but are still reported as unique or modified. Any value is a valid
+    digest (e.g., imohash of an empty file is 0), so these files are told
+    apart by the `hashed` column of `read_csv` rather than by their keys.
+    """
+    hash_key = hashlib.md5(salt.encode()).hexdigest()
+    fpath = np.asarray(fpath, dtype=object)
+    key_hi = pd.util.hash_array(fpath, hash_key=hash_key[:16])
+    key_lo = pd.util.hash_array(fpath, hash_key=hash_key[16:])
+    return key_hi, key_lo
+
+
+def _mix(x):
+    "splitmix64 finaliser, spreads the bits of 64 bit keys"
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def format_checksums(algorithm, key_hi, key_lo):
+    "Renders binary keys back to `algorithm:hexdigest` checksums"
+    keys = np.stack([key_hi, key_lo], axis=1).astype(">u8")
+    octets = keys.view(np.uint8).reshape(-1, KEY_WIDTH // 2)
+    chars = np.empty((len(octets), KEY_WIDTH), dtype=np.uint8)
+    chars[:, 0::2] = _HEX_DIGITS[octets >> 4]
+    chars[:, 1::2] = _HEX_DIGITS[octets & 0x0F]
+    digests = chars.view(f"S{KEY_WIDTH}").ravel().astype(str)
+    return np.char.add(f"{algorithm}:", digests)
+
+
+def add_checksums(df, algorithm, suffix=""):
+    """Derives `checksum` column from `key_hi`, `key_lo` and `hashed` columns.
+
+    Files without checksum (not `hashed`) are rendered as "-". `suffix`
+    selects the side of compare results (i.e., "_left" or "_right").
+    """
+    key_hi = df[f"key_hi{suffix}"]
+    key_lo = df[f"key_lo{suffix}"]
+    hashed = df[f"hashed{suffix}"].to_numpy(dtype=bool, na_value=False)
+    valid = (key_hi.notna() & key_lo.notna()).to_numpy(dtype=bool)
+    checksum = pd.Series(pd.NA, index=df.index, dtype="string")
+    checksum[valid & ~hashed] = "-"
+    valid &= hashed
+    if valid.any():
+        checksum[valid] = format_checksums(
+            algorithm,
+            key_hi[valid].to_numpy(dtype=np.uint64),
+            key_lo[valid].to_numpy(dtype=np.uint64),
+        )
+    return df.assign(**{f"checksum{suffix}": checksum})
+
+
+def apply_filter(df, exclude):
+    """Drops rows excluded by a filter (see `filters.Filter`).
+
+    Paths are matched relative to the common prefix of the checksum file.
+    Directory rules are evaluated once per directory, name rules once per
+    distinct file name.
+    """
+    if not isinstance(exclude, Filter):
+        exclude = Filter.parse(exclude)
+    if not exclude:
+        return df
+    rparents = df.rparent.cat.categories
+    dirs_mask = np.array([exclude.excludes_tree(d) for d in rparents], dtype=bool)
+    mask = dirs_mask[df.rparent.cat.codes]
+    if exclude.file_names:
+        codes, names = pd.factorize(df.fname)
+        names_mask = np.array([bool(exclude.file_names(n)) for n in names])
+        mask |= names_mask[codes]
+    if exclude.file_paths:
+        relpath = add_paths(df, "").rpath.str.lstrip(os.path.sep)
+        mask |= np.array([bool(exclude.file_paths(p)) for p in relpath])
+    columns = {"size": "fsize", "mtime": "mtime"}
+    for field, op, value in exclude.predicates:
+        mask |= op(df[columns[field]], value).to_numpy(dtype=bool)
+    return df[~mask]
+
+
+def read_csv(
+    filename, ignore=None, drop_duplicates=False, exclude=None, subtree=None
+):
     filename = os.path.expanduser(filename)
-    df = pd.read_csv(filename, engine="pyarrow")
+    site = site_name(filename)
+    df = read_table(filename, subtree=subtree).to_pandas()
+    report_memory(f"{site}: loaded", df)
     df = df.rename(columns={"fname": "fpath"})
-    df = df[df.checksum != "-"]
-    df["fname"] = df.fpath.apply(os.path.basename)
-    df["prefix"] = os.path.commonpath(list(df.fpath.apply(os.path.dirname)))
-    df["rpath"] = df.fpath.str.removeprefix(df.prefix[0])
-    df["rparent"] = df.rpath.apply(os.path.dirname)
+    hashed = (df.checksum != "-").to_numpy(dtype=bool)
+    algorithm, keys = parse_checksums(df.checksum[hashed])
+    key_hi = np.zeros(df.shape[0], dtype=np.uint64)
+    key_lo = np.zeros(df.shape[0], dtype=np.uint64)
+    key_hi[hashed] = keys.key_hi
+    key_lo[hashed] = keys.key_lo
+    if not hashed.all():
+        key_hi[~hashed], key_lo[~hashed] = unhashed_keys(df.fpath[~hashed], filename)
+    df = df.drop(columns="checksum")
+    df.insert(0, "hashed", hashed)
+    df.insert(0, "key_lo", key_lo)
+    df.insert(0, "key_hi", key_hi)
+    # hardlinks share an inode; older checksum files have no inode column
+    if "inode" in df:
+        df["inode"] = pd.factorize(df["inode"])[0]
+    else:
+        df["inode"] = np.arange(df.shape[0])
+    df, prefix = compact_paths(df)
     for name, dtype in df.dtypes.items():
         if dtype == "object":
-            df[name] = df[name].astype("str[pyarrow]")
+            df[name] = df[name].astype("string[pyarrow]")
+    report_memory(f"{site}: compacted", df)
     if ignore:
         df = df[~df.rparent.str.contains(ignore)]
         df = df[~df.fname.str.contains(ignore)]
-    df = df.sort_values(by=["checksum", "mtime"])
+    if exclude:
+        df = apply_filter(df, exclude)
+    df = df.sort_values(by=KEY + ["mtime"])
+    # hardlinks to an already seen inode are not duplicates (no extra copy)
     dups = df[
-        df.duplicated(subset=["checksum", "fname"]).values
-        # df.duplicated(subset=["checksum"]).values
+        (
+            df.duplicated(subset=KEY + ["fname"])
+            & ~df.duplicated(subset=KEY + ["fname", "inode"])
+        ).values
+        # df.duplicated(subset=KEY).values
     ]
     if drop_duplicates:
-        df = df.drop_duplicates(subset=["checksum", "fname"])
-        # df = df.drop_duplicates(subset=["checksum"])
+        df = df.drop_duplicates(subset=KEY + ["fname"])
+        # df = df.drop_duplicates(subset=KEY)
     df["mtime"] = pd.to_datetime(df["mtime"], unit="s")
     # _, pool, site = os.path.basename(filename).split("_")
     # site, _ = os.path.splitext(site)
     df.filename = filename
     # df.pool = pool
     # df.site = site
-    df.site = os.path.splitext(os.path.basename(filename))[0]
+    df.site = site
+    df.prefix = prefix
+    df.algorithm = algorithm
     dups.filename = filename
     # dups.pool = pool
     # dups.site = site
-    dups.site = os.path.splitext(os.path.basename(filename))[0]
+    dups.site = site
+    dups.prefix = prefix
+    dups.algorithm = algorithm
     return df, dups
 
 
-def _group_with_max_counts(df, key="rparent_right"):
-    a = [(len(group), group) for gname, group in df.groupby(key)]
-    count, group = sorted(a, key=lambda x: x[0]).pop()
-    return group
+def hardlinks(df):
+    "paths which are additional hardlinks to an inode seen before"
+    return df[df.duplicated(subset="inode").values]
+
+
+def _with_attrs(df, src):
+    "copies frame attributes set by `read_csv` (e.g., site, prefix) from src"
+    for name in ("filename", "site", "prefix", "algorithm"):
+        setattr(df, name, getattr(src, name))
+    return df
+
+
+def _keep_largest(df, by="rparent_left", key="rparent_right"):
+    """keeps the `key` directory with most files for each `by` directory
 
+    Ties go to the last `key` directory. Rows are ordered by `by` directory
+    and keep their order within it."""
+    if df.empty:
+        return df.reset_index(drop=True)
+    width = len(df[key].cat.categories)
+    by_codes = df[by].cat.codes.to_numpy().astype(np.int64)
+    pair = by_codes * width + df[key].cat.codes.to_numpy()
+    pairs, inverse, counts = np.unique(pair, return_inverse=True, return_counts=True)
+    owner = pairs // width
+    # sorted by `by`, count and `key`: the last pair of each `by` wins
+    order = np.lexsort((pairs, counts, owner))
+    last = np.append(owner[order][1:] != owner[order][:-1], True)
+    keep = np.zeros(len(pairs), dtype=bool)
+    keep[order[last]] = True
+    rows = np.flatnonzero(keep[inverse.ravel()])
+    rows = rows[np.argsort(by_codes[rows], kind="stable")]
+    return df.iloc[rows].reset_index(drop=True)
 
-def merge(dl, da, on="checksum", how="inner"):
+
+def merge(dl, da, on=KEY, how="inner", workers=1, claimed=None):
+    """Joins files of `dl` and `da` and associates their directories.
+
+    Each directory of `dl` keeps the directory of `da` sharing most files,
+    and vice versa. `claimed` directories of `da` are already associated
+    with files not in `dl` (see `digests.compare_tree`) and are dropped in
+    between."""
+    if workers > 1 and how == "inner":
+        return _parallel_merge(dl, da, on=on, workers=workers, claimed=claimed)
     m = pd.merge(dl, da, on=on, how=how, suffixes=("_left", "_right"))
-    mm = m.groupby("rparent_left").apply(_group_with_max_counts).reset_index(drop=True)
-    mm = (
-        mm.groupby("rparent_right")
-        .apply(lambda x: _group_with_max_counts(x, key="rparent_left"))
-        .reset_index(drop=True)
+    report_memory(f"merge on {'checksum' if on is KEY else on}", m)
+    return _associate(m, claimed=claimed)
+
+
+def _associate(m, claimed=None):
+    "keeps a single directory pair per directory of merged files"
+    mm = _keep_largest(m, "rparent_left", "rparent_right")
+    return _keep_largest(_unclaimed(mm, claimed), "rparent_right", "rparent_left")
+
+
+def _unclaimed(m, claimed=None):
+    "drops pairs with `claimed` directories of right"
+    if claimed is None or not len(claimed):
+        return m
+    return m[~m.rparent_right.isin(claimed).to_numpy()].reset_index(drop=True)
+
+
+def _name_fanout(left, right):
+    "rows each common file name contributes to the join on file name"
+    fanout = left.fname.value_counts() * right.fname.value_counts()
+    return fanout.dropna().astype(np.int64)
+
+
+def _same_directories(left, right):
+    "directory pairs with the same relative path in left and right"
+    common = left.rparent.cat.categories.intersection(right.rparent.cat.categories)
+    return pd.DataFrame(
+        {
+            "rparent_left": pd.Categorical(
+                common, categories=left.rparent.cat.categories
+            ),
+            "rparent_right": pd.Categorical(
+                common, categories=right.rparent.cat.categories
+            ),
+        }
+    )
+
+
+def _merge_within(left, right, pairs):
+    "joins files of the same name in the given pairs of directories only"
+    pairs = pd.DataFrame(
+        {
+            "_left": pairs.rparent_left.cat.codes.to_numpy(),
+            "_dir": pairs.rparent_right.cat.codes.to_numpy(),
+        }
+    ).drop_duplicates()
+    dl = left.assign(_left=left.rparent.cat.codes.to_numpy())
+    dl = dl.merge(pairs, on="_left").drop(columns="_left")
+    da = right.assign(_dir=right.rparent.cat.codes.to_numpy())
+    m = pd.merge(dl, da, on=["fname", "_dir"], suffixes=("_left", "_right"))
+    return m.drop(columns="_dir")
+
+
+def _merge_bounded(left, right, bounded, pairs):
+    "joins files on name, names in `bounded` only within the given `pairs`"
+    lmask = left.fname.isin(bounded).to_numpy()
+    rmask = right.fname.isin(bounded).to_numpy()
+    return pd.concat(
+        [
+            pd.merge(
+                left[~lmask], right[~rmask], on="fname", suffixes=("_left", "_right")
+            ),
+            _merge_within(left[lmask], right[rmask], pairs),
+        ],
+        ignore_index=True,
     )
-    return mm
+
+
+def merge_names(left, right, by_hash, workers=1, claimed=None):
+    """`merge` on file name, bounded to about `MAX_NAME_JOIN` rows.
+
+    Names like `namelist.config` occur in thousands of run directories, so
+    joining them on name yields a near cartesian product. If the join would
+    exceed the limit, the names contributing most rows are only matched
+    within directories associated by checksum (`by_hash`, see `merge`) or
+    with the same relative path. Below the limit this is `merge` on name.
+    """
+    fanout = _name_fanout(left, right)
+    if fanout.sum() <= MAX_NAME_JOIN:
+        return merge(left, right, on="fname", workers=workers, claimed=claimed)
+    fanout = fanout.sort_values(kind="stable")
+    bounded = fanout.index[fanout.cumsum().to_numpy() > MAX_NAME_JOIN]
+    examples = ", ".join(fanout.index[::-1][:3])
+    print(
+        f"Warning: joining on file name would yield {fanout.sum()} rows; "
+        f"{len(bounded)} names (e.g., {examples}) are matched only within "
+        "associated directories",
+        file=sys.stderr,
+    )
+    pairs = pd.concat(
+        [by_hash[["rparent_left", "rparent_right"]], _same_directories(left, right)]
+    )
+    if workers > 1:
+        return _parallel_merge(
+            left,
+            right,
+            on="fname",
+            workers=workers,
+            claimed=claimed,
+            bounded=list(bounded),
+            pairs=pairs,
+        )
+    m = _merge_bounded(left, right, bounded, pairs)
+    report_memory("bounded merge on fname", m)
+    return _associate(m, claimed=claimed)
+
+
+def _top_level(rparent):
+    "top-level directory of each row of a categorical `rparent` column"
+    tops = rparent.cat.categories.str.split(os.path.sep).str[1]
+    return np.asarray(tops, dtype=object)[rparent.cat.codes.to_numpy()]
+
+
+def _balance(labels, n):
+    "distributes labels of rows over at most `n` lists of similar row count"
+    bins = [[] for _ in range(n)]
+    load = np.zeros(n, dtype=int)
+    for label, count in pd.Series(labels).value_counts().items():
+        i = load.argmin()
+        bins[i].append(label)
+        load[i] += count
+    return [labels for labels in bins if labels]
+
+
+def _concat_groups(parts, by):
+    "concatenates partitions in the order of `df.groupby(by).apply`"
+    df = pd.concat(parts, ignore_index=True)
+    order = np.argsort(df[by].cat.codes.to_numpy(), kind="stable")
+    return df.iloc[order].reset_index(drop=True)
+
+
+def _shared_dir():
+    "directory backed by memory to exchange Arrow files with workers"
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return shm
+    return None
+
+
+def _share(tmpdir, **frames):
+    "writes frames as Arrow IPC files, which workers memory-map"
+    paths = {}
+    for name, df in frames.items():
+        path = os.path.join(tmpdir, f"{name}.arrow")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        paths[name] = path
+    return paths
+
+
+_shared = {}
+
+
+def _attach(paths):
+    "worker initializer: memory-maps the tables shared by `_share`"
+    for name, path in paths.items():
+        _shared[name] = pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def _merge_partition(dirs, on, bounded=None, pairs=None):
+    """merges files of the given directories of left with right
+
+    Only these rows of left, and the rows of right sharing a join key with
+    them, are taken from the memory-mapped tables and converted to frames.
+    With `bounded` names, the join on name is bounded (see `merge_names`)."""
+    left = _shared["left"]
+    left = left.filter(pc.is_in(left["rparent"], value_set=pa.array(dirs)))
+    column = on if isinstance(on, str) else on[0]
+    right = _shared["right"]
+    right = right.filter(pc.is_in(right[column], value_set=pc.unique(left[column])))
+    if bounded is None:
+        m = pd.merge(
+            left.to_pandas(), right.to_pandas(), on=on, suffixes=("_left", "_right")
+        )
+    else:
+        m = _merge_bounded(left.to_pandas(), right.to_pandas(), bounded, pairs)
+    if m.empty:
+        return m
+    return _keep_largest(m, "rparent_left", "rparent_right")
+
+
+def _parallel_merge(
+    dl, da, on=KEY, workers=2, claimed=None, bounded=None, pairs=None
+):
+    """`merge` in a pool of processes, partitioned by top-level directory.
+
+    Both frames are shared with the workers as memory-mapped Arrow files.
+    Top-level directories of `dl` are spread over partitions of similar
+    size, each merged with the files of `da` sharing a join key, so files
+    renamed or moved across partitions are still associated. Directories
+    are associated per `rparent_left` within the partitions and per
+    `rparent_right` once the partitions are combined. The result is
+    identical to `merge`, or to the bounded join of `merge_names` for
+    `bounded` names and directory `pairs`.
+    """
+    nparts = 4 * workers
+    dirs = dl.rparent.cat.categories
+    tops = np.asarray(dirs.str.split(os.path.sep).str[1], dtype=object)
+    with tempfile.TemporaryDirectory(prefix="ptool-", dir=_shared_dir()) as tmpdir:
+        paths = _share(tmpdir, left=dl, right=da)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach, initargs=(paths,)
+        ) as pool:
+            futures = []
+            for part in _balance(_top_level(dl.rparent), nparts):
+                part = list(dirs[np.isin(tops, part)])
+                if pairs is not None:
+                    args = (bounded, pairs[pairs.rparent_left.isin(part).to_numpy()])
+                else:
+                    args = ()
+                futures.append(pool.submit(_merge_partition, part, on, *args))
+            m = _concat_groups([f.result() for f in futures], "rparent_left")
+    # Arrow may change the storage of strings, keep the dtypes of `merge`
+    dtypes = pd.merge(dl[:0], da[:0], on=on, suffixes=("_left", "_right")).dtypes
+    m = m.astype(dtypes.to_dict())
+    report_memory(f"merge on {'checksum' if on is KEY else on}", m)
+    return _keep_largest(_unclaimed(m, claimed), "rparent_right", "rparent_left")
 
 
 def directory_map(m):
     return (m[["rparent_left", "rparent_right"]]).drop_duplicates()
 
 
-def compare(left, right, relabel=False, threshold=0.1):
-    by_hash = merge(left, right)
-    by_name = merge(left, right, on="fname")
+def _suffix_keys(df):
+    "splits shared key columns of a merge on checksum into left and right"
+    for k in KEY:
+        df[f"{k}_right"] = df[k]
+    return df.rename(columns={k: f"{k}_left" for k in KEY})
+
+
+def compare(
+    left, right, relabel=False, threshold=0.1, workers=1, tree=False, paired=None
+):
+    """Associates files of `left` with files of `right` by checksum and name.
+
+    With `workers` > 1, the merges run in a pool of processes partitioned by
+    top-level directory (see `merge`); the results are the same. With
+    `tree`, identical sub-trees are associated by their directory digests
+    first (see `digests.compare_tree`).
+
+    `paired` are results of other files of `left` that are known to be
+    identical (as found by `digests.compare_tree`). Their directories of
+    `right` are not associated with directories of `left` (see `merge`),
+    and they are included in the results.
+    """
+    if left.algorithm and right.algorithm and (left.algorithm != right.algorithm):
+        raise ValueError(
+            f"checksum algorithms differ: {left.algorithm} vs {right.algorithm}"
+        )
+    if tree:
+        from .digests import compare_tree
+
+        results = compare_tree(left, right, threshold=threshold, workers=workers)
+        if relabel:
+            results.columns = [
+                c.replace("left", left.site).replace("right", right.site)
+                for c in results.columns
+            ]
+        return results
+    claimed = None if paired is None else paired.rparent_right.unique()
+    by_hash = merge(left, right, workers=workers, claimed=claimed)
+    by_name = merge_names(left, right, by_hash, workers=workers, claimed=claimed)
     by_hash["flag"] = ""
     by_name["flag"] = ""
-    common_hashes = list(by_hash.checksum)
-    common_names = list(by_name.checksum_left)
-    common_cs = list(set(common_hashes + common_names))
+    common_hashes = by_hash[KEY]
+    common_names = by_name[[f"{k}_left" for k in KEY]].set_axis(KEY, axis=1)
+    common = [common_hashes, common_names]
+    if paired is not None:
+        common.append(paired[[f"{k}_left" for k in KEY]].set_axis(KEY, axis=1))
+    common_cs = pd.MultiIndex.from_frame(pd.concat(common))
     renamed_mask = by_hash.fname_left != by_hash.fname_right
     renamed_df = by_hash[renamed_mask]
     results = {}
@@ -90,21 +662,22 @@ def compare(left, right, relabel=False, threshold=0.1):
         renamed_df = renamed_df.copy()
         renamed_df["flag"] = "renamed"
         renamed_df.set_index("flag", inplace=True)
-        renamed_df["checksum_right"] = renamed_df["checksum"]
-        renamed_df.rename(columns={"checksum": "checksum_left"}, inplace=True)
+        renamed_df = _suffix_keys(renamed_df)
         results["renamed"] = renamed_df
         by_hash = by_hash[~renamed_mask]
     ## identify identical files (both checksum and filename match)
     by_hash = by_hash.copy()
     by_hash["flag"] = "identical"
     by_hash.set_index("flag", inplace=True)
-    by_hash["checksum_right"] = by_hash["checksum"]
-    by_hash.rename(columns={"checksum": "checksum_left"}, inplace=True)
-    results["identical"] = by_hash
+    by_hash = _suffix_keys(by_hash)
+    results["identical"] = by_hash if paired is None else pd.concat([paired, by_hash])
     ## identify modified files (filename matches but not checksum)
     ## latest mtime in the file-pair is the most recent one
     ## This means, indicating which of the pairs is latest is useful
-    modified = by_name[by_name.checksum_left != by_name.checksum_right]
+    modified = by_name[
+        (by_name.key_hi_left != by_name.key_hi_right)
+        | (by_name.key_lo_left != by_name.key_lo_right)
+    ]
     left_latest = modified[modified.mtime_left > modified.mtime_right]
     if not left_latest.empty:
         left_latest = left_latest.copy()
@@ -122,7 +695,7 @@ def compare(left, right, relabel=False, threshold=0.1):
         right_latest.rename(columns={"fname": "fname_left"}, inplace=True)
         results["modified_latest_right"] = right_latest
     ## unique files (files found only on left site (i.e., first argument))
-    left_only = left[~left.checksum.isin(common_cs)]
+    left_only = left[~pd.MultiIndex.from_frame(left[KEY]).isin(common_cs)]
     if not left_only.empty:
         left_only = left_only.copy()
         left_only["flag"] = "unique"
@@ -137,13 +710,18 @@ def compare(left, right, relabel=False, threshold=0.1):
         "modified_latest_right": 4,
         "unique": 5,
     }
+    for res in results.values():
+        # nullable integers keep keys exact when right side is missing
+        for col in res.columns.intersection([f"{k}_right" for k in KEY]):
+            res[col] = res[col].astype("UInt64")
     results = pd.concat([results[key] for key in sorted(results, key=order.get)])
     if threshold:
         results = _correct_false_positive(results, threshold=threshold)
     # The following drop_duplicates makes sure that there is
     # always 1:1 mapping of files. More precisely it eliminates
     # many:1 mapping.
-    results = results.drop_duplicates("rpath_left")
+    results = results.drop_duplicates(["rparent_left", "fname_left"])
+    report_memory("compare", results)
     if relabel:
         newcols = [
             c.replace("left", left.site).replace("right", right.site)
@@ -158,7 +736,7 @@ def _correct_false_positive(df, threshold=0.1):
     partial_dfs = []
     right_cols = [c for c in df.columns if c.endswith("right")]
     # default = df.loc['unique'][right_cols].iloc[0].values
-    for name, grp in df.groupby("rparent_left"):
+    for name, grp in df.groupby("rparent_left", observed=True):
         val_counts = dict(grp.index.value_counts())
         total_count = sum(val_counts.values())
         if "unique" in val_counts:
@@ -168,7 +746,7 @@ def _correct_false_positive(df, threshold=0.1):
             grp.index = [
                 "unique",
             ] * grp.index.size
-            grp[right_cols] = ""
+            grp.loc[:, right_cols] = np.nan
             partial_dfs.append(grp)
         else:
             dfs.append(grp)
@@ -180,15 +758,22 @@ def _correct_false_positive(df, threshold=0.1):
             ]
             + partial_dfs
         )
-    df = df.replace(r"^\s*$", np.nan, regex=True)
     df.index = df.index.set_names("flag")
     return df
 
 
-def compare_compact(left, right, columns="rpath", threshold=0.1, relabel=False):
-    df = compare(left, right, threshold=threshold)
+def compare_compact(
+    left, right, columns="rpath", threshold=0.1, relabel=False, workers=1, tree=False
+):
+    df = compare(left, right, threshold=threshold, workers=workers, tree=tree)
     if isinstance(columns, str):
         columns = columns.split(",")
+    if {"rpath", "fpath"} & set(columns):
+        df = add_paths(df, left.prefix, "_left")
+        df = add_paths(df, right.prefix, "_right")
+    if "checksum" in columns:
+        df = add_checksums(df, left.algorithm, "_left")
+        df = add_checksums(df, right.algorithm, "_right")
     cols = []
     for col in columns:
         cols.append(col + "_left")
@@ -213,23 +798,25 @@ def compare_directory_view(left, right, fullpath=False, relabel=True):
     if relabel:
         correct_gname = lambda x: x.replace("left", "first").replace("right", "second")
     if fullpath:
-        c["fparent_left"] = c["fpath_left"].apply(os.path.dirname)
+        c["fparent_left"] = left.prefix + c["rparent_left"].astype("string")
         groupkey = "fparent_left"
     else:
         groupkey = "rparent_left"
-    for gname, group in c.groupby(groupkey):
+    for gname, group in c.groupby(groupkey, observed=True):
         total_files = group.shape[0]
         summary = {
             correct_gname(_gname): f"{_g.shape[0]}/{total_files}"
             for _gname, _g in group.groupby("flag")
         }
-        try:
+        rparent_left = group.rparent_left.iloc[0]
+        rparent_right = group.rparent_right.iloc[0]
+        if pd.isna(rparent_right):
+            summary["paths"] = left.prefix + rparent_left
+        else:
             summary["paths"] = [
-                os.path.dirname(group.fpath_left.iloc[0]),
-                os.path.dirname(group.fpath_right.iloc[0]),
+                left.prefix + rparent_left,
+                right.prefix + rparent_right,
             ]
-        except TypeError:
-            summary["paths"] = os.path.dirname(group.fpath_left.iloc[0])
         dm[gname]["summary"] = summary
         d = {}
         for _gname, _g in group.groupby("flag"):
@@ -243,6 +830,129 @@ def compare_directory_view(left, right, fullpath=False, relabel=True):
     return dict(dm)
 
 
+def estimate(
+    left,
+    right,
+    fraction=0.1,
+    threshold=0.1,
+    confidence=0.95,
+    seed=None,
+    workers=1,
+    tree=False,
+):
+    """Estimates compare results from a stratified sample of directories.
+
+    Directories of `left` are grouped into strata by their top-level
+    directory and `fraction` of the directories of each stratum (at least
+    2) are compared against the full `right`. Per flag, the number of files
+    and bytes are estimated with the stratified cluster estimator along with
+    the half-width of the `confidence` interval (normal approximation).
+    """
+    rng = np.random.default_rng(seed)
+    dirs = pd.Series(left.rparent.unique().astype(str))
+    strata = dirs.str.strip(os.path.sep).str.split(os.path.sep).str[0]
+    sampled = []
+    sizes = {}
+    for stratum, group in dirs.groupby(strata):
+        n = min(len(group), max(2, int(np.ceil(fraction * len(group)))))
+        sampled.extend(rng.choice(group.values, size=n, replace=False))
+        sizes[stratum] = len(group)
+    sample = _with_attrs(left[left.rparent.isin(sampled)], left)
+    cmp = compare(
+        sample, right, threshold=threshold, workers=workers, tree=tree
+    ).reset_index()
+    cmp["flag"] = cmp["flag"].str.replace(r"^modified.*", "modified", regex=True)
+    cmp["rparent_left"] = cmp["rparent_left"].astype(str)
+    files = pd.crosstab(cmp.rparent_left, cmp.flag)
+    nbytes = pd.crosstab(cmp.rparent_left, cmp.flag, values=cmp.fsize_left, aggfunc="sum")
+    files = files.reindex(sampled, fill_value=0)
+    nbytes = nbytes.reindex(sampled).fillna(0)
+    stratum_of = dict(zip(dirs, strata))
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    result = {}
+    for name, values in (("files", files), ("bytes", nbytes)):
+        total = 0
+        variance = 0
+        for stratum, group in values.groupby(values.index.map(stratum_of)):
+            N, n = sizes[stratum], len(group)
+            total = total + N * group.mean()
+            if n > 1:
+                variance = variance + N**2 * (1 - n / N) * group.var(ddof=1) / n
+        result[name] = total
+        result[f"{name} ci"] = z * np.sqrt(variance)
+    result = pd.DataFrame(result).fillna(0)
+    result["fraction"] = result["files"] / left.shape[0]
+    result["fraction ci"] = result["files ci"] / left.shape[0]
+    result.sampled_dirs = len(sampled)
+    result.total_dirs = len(dirs)
+    return result
+
+
+def summary_estimate(
+    filename1,
+    filename2,
+    ignore=None,
+    fraction=0.1,
+    threshold=0.1,
+    confidence=0.95,
+    seed=None,
+    exclude=None,
+    subtree=None,
+    drop_duplicates=False,
+    workers=1,
+    tree=False,
+):
+    "Prints estimated summary based on a sample of directories (see `estimate`)"
+    left, _ = read_csv(
+        filename1,
+        ignore=ignore,
+        drop_duplicates=drop_duplicates,
+        exclude=exclude,
+        subtree=subtree,
+    )
+    right, _ = read_csv(
+        filename2,
+        ignore=ignore,
+        drop_duplicates=drop_duplicates,
+        exclude=exclude,
+        subtree=subtree,
+    )
+    est = estimate(
+        left,
+        right,
+        fraction=fraction,
+        threshold=threshold,
+        confidence=confidence,
+        seed=seed,
+        workers=workers,
+        tree=tree,
+    )
+    hsize = lambda x: humanize.naturalsize(x)
+    order = {"identical": 1, "renamed": 2, "modified": 3, "unique": 4}
+    rows = {}
+    for flag in sorted(est.index, key=order.get):
+        row = est.loc[flag]
+        rows[flag] = {
+            "files": f"{row['files']:.0f} ± {row['files ci']:.0f}",
+            "fraction": f"{row['fraction']:.1%} ± {row['fraction ci']:.1%}",
+            "size": f"{hsize(row['bytes'])} ± {hsize(row['bytes ci'])}",
+        }
+    df = pd.DataFrame(rows).transpose()
+
+    import tabulate
+
+    print(
+        f"\nEstimated summary with respect to {left.site.upper()} "
+        f"({est.sampled_dirs} of {est.total_dirs} directories sampled, "
+        f"{confidence:.0%} confidence)\n"
+    )
+    print(f"{left.site}: {left.shape[0]} files ({hsize(left.fsize.sum())})")
+    print(f"{right.site}: {right.shape[0]} files ({hsize(right.fsize.sum())})\n")
+    print(tabulate.tabulate(df, headers="keys"))
+    print("-" * 70)
+    return est
+
+
 def summary(
     filename1,
     filename2,
@@ -250,12 +960,24 @@ def summary(
     compact=False,
     drop_duplicates=False,
     threshold=0.1,
+    exclude=None,
+    workers=1,
+    tree=False,
+    subtree=None,
 ):
     left, left_dups = read_csv(
-        filename1, ignore=ignore, drop_duplicates=drop_duplicates
+        filename1,
+        ignore=ignore,
+        drop_duplicates=drop_duplicates,
+        exclude=exclude,
+        subtree=subtree,
     )
     right, right_dups = read_csv(
-        filename2, ignore=ignore, drop_duplicates=drop_duplicates
+        filename2,
+        ignore=ignore,
+        drop_duplicates=drop_duplicates,
+        exclude=exclude,
+        subtree=subtree,
     )
     # _, left_pool, left_site = filename1.split("_")
     # left_site, _ = os.path.splitext(left_site)
@@ -264,26 +986,28 @@ def summary(
     left_site = left.site
     right_site = right.site
     hsize = lambda x: humanize.naturalsize(x)
-    left_pool = left.prefix.iloc[0]
-    left_pool = os.path.basename(left_pool.rstrip(os.path.sep))
-    right_pool = right.prefix.iloc[0]
-    right_pool = os.path.basename(right_pool.rstrip(os.path.sep))
+    left_pool = os.path.basename(left.prefix.rstrip(os.path.sep))
+    right_pool = os.path.basename(right.prefix.rstrip(os.path.sep))
     dset = {}
     dset[left_site] = {
         "pool": left_pool,
         "checksum file": filename1,
-        "prefix": left.prefix.iloc[0],
+        "prefix": left.prefix,
         "files": f"{left.shape[0]} ({hsize(left.fsize.sum())})",
         "duplicate files": f"{left_dups.shape[0]} ({hsize(left_dups.fsize.sum())})",
     }
     dset[right_site] = {
         "pool": right_pool,
         "checksum file": filename2,
-        "prefix": right.prefix.iloc[0],
+        "prefix": right.prefix,
         "files": f"{right.shape[0]} ({hsize(right.fsize.sum())})",
         "duplicate files": f"{right_dups.shape[0]} ({hsize(right_dups.fsize.sum())})",
     }
-    cmp = compare(left, right, threshold=threshold)
+    for site, df in ((left_site, left), (right_site, right)):
+        links = hardlinks(df)
+        if not links.empty:
+            dset[site]["hardlinks"] = f"{links.shape[0]} ({hsize(links.fsize.sum())})"
+    cmp = compare(left, right, threshold=threshold, workers=workers, tree=tree)
     if "identical" in cmp.index:
         identical = cmp.loc[["identical"]]
         dset[left_site][
@@ -319,9 +1043,6 @@ def summary(
     import tabulate
 
     print(tabulate.tabulate(df, headers="keys"))
-    m = merge(left, right)
-    # dmap = directory_map(m)
-    # dmap = dmap[dmap.rparent_left != dmap.rparent_right]
     dmap = (cmp[["rparent_left", "rparent_right"]]).dropna().drop_duplicates()
     print("-" * 70)
     if not dmap.empty:
@@ -342,7 +1063,7 @@ def summary(
         return x
 
     dm = {}
-    for gname, group in c.groupby("rparent_left"):
+    for gname, group in c.groupby("rparent_left", observed=True):
         summary = {
             correct_gname(_gname): f"{_g.shape[0]}"
             for _gname, _g in group.groupby("flag")
@@ -1,16 +1,24 @@
 #!/usr/bin/env python
 
-import fnmatch
+import gzip
+import json
 import os
 import re
 import sys
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from contextlib import contextmanager
-from typing import Callable, List, Optional
+from typing import Optional
 
 import click
 from imohash import hashfile
-from tqdm.contrib.concurrent import process_map
+from tqdm.contrib.concurrent import process_map, thread_map
+
+try:
+    from .filters import Filter, make_filter
+except ImportError:
+    # used as a standalone script (next to filters.py)
+    from filters import Filter, make_filter
 
 not_hidden_files_or_dirs = re.compile(r"^[^.]").match
 
@@ -29,64 +37,90 @@ def getecho():
 echo = getecho()
 
 
-def ignore_re(pattern: str = None) -> Callable:
-    """matches files or folders based provided pattern.
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
 
-    If *wildcards* are not present in pattern, then this function looks for
-    exact match to the pattern.
 
-    comma separated multiple patterns are allowed.
-    """
-    pats = [lambda x: False]
-    if pattern:
-        pats = [fnmatch._compile_pattern(p) for p in split(pattern)]
-
-    def ignore(value: str) -> bool:
-        for pat in pats:
-            if pat(value):
-                return True
-        else:
-            return False
+def infer_compression(filename: str) -> Optional[str]:
+    "compression type based on file extension of filename"
+    _, ext = os.path.splitext(filename)
+    return COMPRESSION_EXTENSIONS.get(ext)
 
-    return ignore
 
+def check_compression(filename: str, compression: Optional[str] = None):
+    """Raises UsageError if `compression` does not match the extension of filename.
 
-def split(s: str, sep: str = ",", escape: str = "\\") -> List[Optional[str]]:
-    """Split the string with respect to `sep` character
+    Readers infer compression from the extension alone (see `open_infile`)."""
+    if compression is None or filename == "-":
+        return
+    if infer_compression(filename) != compression:
+        ext = {v: k for k, v in COMPRESSION_EXTENSIONS.items()}[compression]
+        raise click.UsageError(
+            f"{compression} compressed output needs a {ext} extension: {filename}"
+        )
 
-    To preserve `sep` character in the string at certain places, prefix it with
-    escape character. The default escape character is "\\" but it can also
-    replaced with some other character if it is required. See examples.
 
-    Examples:
+@contextmanager
+def open_outfile(filename: str = "-", compression: Optional[str] = None):
+    """Opens filename for writing text, compressing on the fly.
 
-    >>> split("core1,core2")
-    ["core1", "core2"]
-    >>> split("core1\,group,core2")
-    ["core1,group", "core2"]
-    >>> split("a,b\,c,d")
-    ['a', 'b,c', 'd']
-    >>> split("a|b\|c|d", sep="|")
-    ['a', 'b|c', 'd']
-    >>> split("a|b#|c|d", sep="|", escape="#")
-    ['a', 'b|c', 'd']
+    `compression` is one of "gzip" or "zstd". If not provided, it is inferred
+    from the extension of filename (.gz or .zst), which it must match (see
+    `check_compression`). "-" writes to stdout. zstd compression uses the
+    `zstandard` package and all available cores.
     """
-    if not s:
-        return []
-    empty = ""
-    result = []
-    tmp = []
-    for part in s.split(sep):
-        if escape in part:
-            tmp.append(part.replace(escape, empty))
+    check_compression(filename, compression)
+    if compression is None:
+        compression = infer_compression(filename)
+    if compression is None:
+        if filename == "-":
+            yield sys.stdout
+            sys.stdout.flush()
         else:
-            if tmp:
-                tmp.append(part)
-                result.append(f"{sep}".join(tmp))
-                tmp.clear()
-            else:
-                result.append(part)
-    return result
+            with open(os.path.expanduser(filename), "w") as fid:
+                yield fid
+        return
+    if filename == "-":
+        raw = sys.stdout.buffer
+    else:
+        raw = open(os.path.expanduser(filename), "wb")
+    try:
+        if compression == "gzip":
+            fid = gzip.open(raw, "wt", compresslevel=6)
+        else:
+            try:
+                import zstandard
+            except ImportError:
+                raise click.UsageError(
+                    "zstd compression requires the `zstandard` package"
+                )
+            cctx = zstandard.ZstdCompressor(threads=-1)
+            fid = zstandard.open(raw, "wt", cctx=cctx, closefd=False)
+        with fid:
+            yield fid
+    finally:
+        if raw is sys.stdout.buffer:
+            raw.flush()
+        else:
+            raw.close()
+
+
+@contextmanager
+def open_infile(filename: str):
+    "Opens (possibly gzip or zstd compressed) filename for reading text"
+    filename = os.path.expanduser(filename)
+    compression = infer_compression(filename)
+    if compression == "gzip":
+        fid = gzip.open(filename, "rt")
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise click.UsageError("zstd compression requires the `zstandard` package")
+        fid = zstandard.open(filename, "rt")
+    else:
+        fid = open(filename)
+    with fid:
+        yield fid
 
 
 @contextmanager
@@ -117,40 +151,138 @@ class Results:
         return self.value
 
 
+HEADER = "checksum,fsize,mtime,inode,fpath"
+
+
 def hasher(filename):
     "Calucates imohash for a given file"
     return f"imohash:{hashfile(filename, hexdigest=True)}"
 
 
-def stats(fpath, stat=os.stat):
-    "Generates record with imohash and file stats information"
+def inode(st):
+    "identifies the file (inode) behind a path, shared by all its hardlinks"
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+def hash_file(fpath):
+    "Calculates checksum of a file"
+    try:
+        return Results(value=hasher(fpath))
+    except Exception as e:
+        return Results(exc=f"{str(e)}")
+
+
+def metadata(fpath, stat=os.stat):
+    "Gathers (fpath, fsize, mtime, inode) of a file without reading it"
     try:
-        checksum = hasher(fpath)
         st = stat(fpath)
-        record = f"{checksum},{st.st_size},{st.st_mtime},{fpath}"
-        record = Results(value=record)
+        record = Results(value=(fpath, st.st_size, st.st_mtime, inode(st)))
     except Exception as e:
         record = Results(exc=f"{str(e)}")
     return record
 
 
-def scanner(path, ignore=None, ignore_dirs=None, drop_hidden_files=True):
-    """Produces iterator object which recursively scans a path.
-    Silimar to os.walk but better in performance."""
-    path = os.path.expanduser(path)
+def gather_metadata(files, max_workers=None):
+    """Stats files using a thread pool (file systems calls are latency bound)
+
+    Returns list of (fpath, fsize, mtime, inode) and errors."""
+    echo("Gathering metadata...")
+    items = []
+    errors = []
+    with timethis("gathering metadata"):
+        for item in thread_map(
+            metadata,
+            files,
+            chunksize=100,
+            max_workers=max_workers or 4 * os.cpu_count(),
+            unit="files",
+        ):
+            if item.has_error():
+                errors.append(item)
+            else:
+                items.append(item.result())
+    return items, errors
+
+
+def read_candidates(filename):
+    """Collects file sizes and file names found in a checksum (or metadata) file.
+
+    Files of the other site can only be identical to local files of the same
+    size and can only be modified versions of local files of the same name.
+    """
+    sizes = set()
+    names = set()
+    with open_infile(filename) as fid:
+        header = next(fid).rstrip("\n").split(",")
+        ncols = len(header)
+        idx = header.index("fsize")
+        for line in fid:
+            fields = line.rstrip("\n").split(",", ncols - 1)
+            sizes.add(int(fields[idx]))
+            names.add(os.path.basename(fields[-1]))
+    return sizes, names
+
+
+def select_candidates(items, candidates=None):
+    """Selects files (as gathered by `gather_metadata`) worth hashing.
+
+    If `candidates` (checksum file of the other site) is provided, only files
+    whose size or name occurs in it are selected. Otherwise no file is
+    selected (metadata only). Returns selected and remaining items.
+    """
+    sizes, names = set(), set()
+    if candidates:
+        sizes, names = read_candidates(candidates)
+    selected = []
+    remaining = []
+    for item in items:
+        fpath, fsize, _, _ = item
+        if (fsize in sizes) or (os.path.basename(fpath) in names):
+            selected.append(item)
+        else:
+            remaining.append(item)
+    echo(f"files selected for hashing: {len(selected)}")
+    return selected, remaining
+
+
+def hash_inodes(items, max_workers=None, chunksize=10):
+    """Calculates checksums of files (as gathered by `gather_metadata`).
+
+    Hardlinked paths share an inode, which is read only once. Returns the
+    records of all paths and errors."""
+    paths = {}
+    for fpath, _, _, ino in items:
+        paths.setdefault(ino, fpath)
+    echo(f"Calculating hashes... ({len(paths)} inodes for {len(items)} files)")
+    with timethis("calculating hashes"):
+        futures = process_map(
+            hash_file,
+            list(paths.values()),
+            chunksize=chunksize,
+            max_workers=max_workers or os.cpu_count(),
+            unit="files",
+        )
+    checksums = dict(zip(paths, futures))
+    records = []
+    errors = []
+    for fpath, fsize, mtime, ino in items:
+        item = checksums[ino]
+        if item.has_error():
+            errors.append(item)
+        else:
+            records.append(f"{item.result()},{fsize},{mtime},{ino},{fpath}")
+    return records, errors
+
+
+def _scandir(path):
+    "Lists names of files and directories at path (symlinks are followed)"
+    files = []
     dirs = []
-    to_ignore = ignore_re(ignore)
-    to_ignore_dirs = ignore_re(ignore_dirs)
     for i in os.scandir(path):
-        if i.is_file() and (not to_ignore(i.name)):
-            if drop_hidden_files:
-                if not_hidden_files_or_dirs(i.name):
-                    yield i.path
-            else:
-                yield i.path
-        elif i.is_dir() and (not to_ignore_dirs(i.name)):
-            if not_hidden_files_or_dirs(i.name):
-                dirs.append(i.path)
+        if i.is_file():
+            files.append(i.name)
+        elif i.is_dir():
+            dirs.append(i.name)
         elif i.is_symlink():
             try:
                 i.stat()
@@ -158,28 +290,279 @@ def scanner(path, ignore=None, ignore_dirs=None, drop_hidden_files=True):
                 echo(f"skipping.. {i.path} -> {os.readlink(i.path)}")
             except Exception as e:
                 echo(f"{e.__class__.__name__}: {str(e)}")
-            else:
-                if os.path.isdir(i.path):
-                    dirs.append(i.path)
-                elif os.path.isfile(i.path):
-                    yield i.path
-    for d in dirs:
-        yield from scanner(d, ignore, ignore_dirs, drop_hidden_files)
+    return files, dirs
 
 
-def get_files(path, ignore=None, ignore_dirs=None, drop_hidden_files=True):
+class ScanCache:
+    """Sidecar cache of a previous scan for fast incremental runs.
+
+    Holds the listing and mtime of every directory and the checksum, size
+    and mtime of every file seen in the previous run. A directory whose
+    mtime is unchanged is not re-listed; its previous listing is reused.
+    Metadata of files is gathered anew to catch in-place modifications
+    (see `record`) and files are only re-hashed if their size, mtime or
+    inode changed. With ``restat=False`` files in
+    unchanged directories are trusted without a stat call.
+
+    Entries modified within ``racy`` seconds of the scan are not cached as
+    further changes within the same timestamp granularity can go unnoticed.
+    """
+
+    def __init__(self, dirs=None, files=None, restat=True, racy=2.0):
+        self.dirs = dirs or {}
+        self.files = files or {}
+        self.restat = restat
+        self.racy = racy
+        self.unchanged = set()
+        self.started = time.time()
+        self._dirs = {}
+        self._files = {}
+
+    @classmethod
+    def load(cls, filename, restat=True):
+        "reads cache from filename, starts with an empty cache if it does not exist"
+        filename = os.path.expanduser(filename)
+        if not os.path.exists(filename):
+            return cls(restat=restat)
+        with open(filename) as fid:
+            data = json.load(fid)
+        return cls(dirs=data["dirs"], files=data["files"], restat=restat)
+
+    def save(self, filename):
+        "writes entries seen in the current scan, stale entries are dropped"
+        filename = os.path.expanduser(filename)
+        tmpfile = f"{filename}.tmp"
+        with open(tmpfile, "w") as fid:
+            json.dump({"dirs": self._dirs, "files": self._files}, fid)
+        os.replace(tmpfile, filename)
+
+    def _is_racy(self, mtime):
+        return mtime >= self.started - self.racy
+
+    def listdir(self, path):
+        "Lists path, reusing the previous listing if directory mtime is unchanged"
+        mtime = os.stat(path).st_mtime
+        entry = self.dirs.get(path)
+        if entry and entry["mtime"] == mtime:
+            self.unchanged.add(path)
+            files, dirs = entry["files"], entry["dirs"]
+        else:
+            files, dirs = _scandir(path)
+        if not self._is_racy(mtime):
+            self._dirs[path] = {"mtime": mtime, "files": files, "dirs": dirs}
+        return files, dirs
+
+    def _cached(self, fpath):
+        item = self.files.get(fpath)
+        if item is None or len(item) != 4:
+            return None
+        return item
+
+    def _reuse(self, fpath, item):
+        checksum, size, mtime, ino = item
+        self._files[fpath] = item
+        return f"{checksum},{size},{mtime},{ino},{fpath}"
+
+    def trusted(self, fpath):
+        """Returns cached inventory record for fpath without a stat call
+
+        Only with ``restat=False`` and for files in unchanged directories."""
+        if self.restat or (os.path.dirname(fpath) not in self.unchanged):
+            return None
+        item = self._cached(fpath)
+        if item is None:
+            return None
+        return self._reuse(fpath, item)
+
+    def record(self, metadata):
+        """Returns cached inventory record if it is still valid
+
+        `metadata` is (fpath, fsize, mtime, inode) of the file as gathered by
+        `gather_metadata`."""
+        fpath, size, mtime, ino = metadata
+        item = self._cached(fpath)
+        if item is None or item[1:] != [size, mtime, ino]:
+            return None
+        return self._reuse(fpath, item)
+
+    def update(self, record):
+        "Adds a freshly calculated inventory record to the cache"
+        checksum, size, mtime, ino, fpath = record.split(",", 4)
+        mtime = float(mtime)
+        if not self._is_racy(mtime):
+            self._files[fpath] = [checksum, int(size), mtime, ino]
+
+
+def _entries(path, relpath, exclude, drop_hidden_files=True, cache=None):
+    """Lists a single directory and applies the filters.
+
+    Returns paths of files and (path, relpath) of sub-directories."""
+    if cache is None:
+        files, dirs = _scandir(path)
+    else:
+        files, dirs = cache.listdir(path)
+    fpaths = []
+    for name in files:
+        if drop_hidden_files and not not_hidden_files_or_dirs(name):
+            continue
+        fpath = os.path.join(path, name)
+        if exclude and exclude.excludes_file(
+            os.path.join(relpath, name), lambda: os.stat(fpath)
+        ):
+            continue
+        fpaths.append(fpath)
+    subdirs = []
+    for name in dirs:
+        if not not_hidden_files_or_dirs(name):
+            continue
+        drelpath = os.path.join(relpath, name)
+        if exclude and exclude.excludes_dir(drelpath):
+            continue
+        subdirs.append((os.path.join(path, name), drelpath))
+    return fpaths, subdirs
+
+
+def scanner(
+    path,
+    ignore=None,
+    ignore_dirs=None,
+    drop_hidden_files=True,
+    cache=None,
+    exclude=None,
+    _relpath="",
+):
+    """Produces iterator object which recursively scans a path.
+    Silimar to os.walk but better in performance.
+
+    `exclude` is a filter expression or a compiled `Filter`. Excluded
+    directories are pruned, i.e., they are never listed. If a `ScanCache` is
+    provided, directories unchanged since the previous scan are not
+    re-listed."""
+    path = os.path.expanduser(path)
+    if not isinstance(exclude, Filter):
+        exclude = make_filter(exclude, ignore=ignore, ignore_dirs=ignore_dirs)
+    files, subdirs = _entries(path, _relpath, exclude, drop_hidden_files, cache)
+    yield from files
+    for dpath, drelpath in subdirs:
+        yield from scanner(
+            dpath,
+            drop_hidden_files=drop_hidden_files,
+            cache=cache,
+            exclude=exclude,
+            _relpath=drelpath,
+        )
+
+
+def parallel_scanner(
+    path,
+    ignore=None,
+    ignore_dirs=None,
+    drop_hidden_files=True,
+    cache=None,
+    exclude=None,
+    threads=8,
+):
+    """Same as `scanner` but lists directories concurrently using threads.
+
+    On parallel file systems listing a directory is dominated by latency of
+    the metadata server, so keeping several requests in flight pays off.
+    The order of the files differs from `scanner`."""
+    path = os.path.expanduser(path)
+    if not isinstance(exclude, Filter):
+        exclude = make_filter(exclude, ignore=ignore, ignore_dirs=ignore_dirs)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = {
+            pool.submit(_entries, path, "", exclude, drop_hidden_files, cache)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                yield from files
+                for dpath, drelpath in subdirs:
+                    pending.add(
+                        pool.submit(
+                            _entries, dpath, drelpath, exclude, drop_hidden_files, cache
+                        )
+                    )
+
+
+def get_files(
+    path,
+    ignore=None,
+    ignore_dirs=None,
+    drop_hidden_files=True,
+    cache=None,
+    exclude=None,
+    walk_threads=1,
+):
     "Wrapper around scanner method to produce a list of files instead of iterator"
-    files_iter = scanner(
-        path,
+    kwargs = dict(
         ignore=ignore,
         ignore_dirs=ignore_dirs,
         drop_hidden_files=drop_hidden_files,
+        cache=cache,
+        exclude=exclude,
     )
+    if walk_threads and walk_threads > 1:
+        files_iter = parallel_scanner(path, threads=walk_threads, **kwargs)
+    else:
+        files_iter = scanner(path, **kwargs)
     return list(files_iter)
 
 
-def main(path, outfile, ignore=None, ignore_dirs=None, drop_hidden_files=True):
-    "Calculates hashs of all the files in parallel"
+def get_profile(name=None):
+    """Performance profile of the `checksums` command for this site.
+
+    The site is determined by hostname unless `name` is given (see
+    ``ptool_config.yaml``). Returns name of the site and its settings."""
+    try:
+        from .utils import site_profile
+    except ImportError:
+        # used as a standalone script or without pyyaml
+        return "local", {}
+    return site_profile("checksums", computer=name)
+
+
+def main(
+    path,
+    outfile,
+    ignore=None,
+    ignore_dirs=None,
+    drop_hidden_files=True,
+    cache_file=None,
+    restat=True,
+    compression=None,
+    exclude=None,
+    metadata_only=False,
+    candidates=None,
+    profile=None,
+    digests=False,
+):
+    """Calculates hashs of all the files in parallel
+
+    Results are written to `outfile` (filename or "-" for stdout), compressed
+    on the fly if `compression` is given or implied by the file extension.
+
+    With `metadata_only`, no file is hashed and the checksum column is "-".
+    With `candidates` (checksum or metadata file of the other site), only
+    files that can have a counterpart there (same size or same name) are
+    hashed.
+
+    With `digests`, Merkle digests of all directories are written next to
+    `outfile` (see `ptool.digests`).
+
+    Worker counts, batch sizes, default exclusion rules and compression of
+    stdout are taken from the site profile (`profile` or by hostname)."""
+    check_compression(outfile, compression)
+    site, settings = get_profile(profile)
+    echo(f"site profile: {site}")
+    exclude = ",".join(filter(None, [settings.get("exclude"), exclude])) or None
+    if compression is None and outfile == "-":
+        compression = settings.get("compression")
+    cache = None
+    if cache_file:
+        cache = ScanCache.load(cache_file, restat=restat)
     echo("Gathering files...")
     with timethis("getting files"):
         if os.path.isdir(path):
@@ -188,31 +571,73 @@ def main(path, outfile, ignore=None, ignore_dirs=None, drop_hidden_files=True):
                 ignore=ignore,
                 ignore_dirs=ignore_dirs,
                 drop_hidden_files=drop_hidden_files,
+                cache=cache,
+                exclude=exclude,
+                walk_threads=settings.get("walk_threads"),
             )
         else:
             files = [path]
     nfiles = len(files)
     echo(f"nfiles: {nfiles}")
-    results = ["checksum,fsize,mtime,fpath"]
-    echo("Calculating hashes...")
-    errors = []
-    with timethis("calculating hashes"):
-        futures = process_map(
-            stats, files, chunksize=10, max_workers=os.cpu_count(), unit="files"
-        )
-        for item in futures:
-            if item.has_error():
-                errors.append(item)
+    results = [HEADER]
+    if cache is not None:
+        # files of unchanged directories are only trusted with --no-restat
+        unknown = []
+        for fpath in files:
+            record = cache.trusted(fpath)
+            if record is None:
+                unknown.append(fpath)
+            else:
+                results.append(record)
+        files = unknown
+    items, errors = gather_metadata(files, max_workers=settings.get("io_depth"))
+    if cache is not None:
+        to_hash = []
+        for item in items:
+            record = cache.record(item)
+            if record is None:
+                to_hash.append(item)
             else:
-                results.append(item.result())
+                results.append(record)
+        echo(f"reusing cached checksums: {len(results) - 1}")
+        items = to_hash
+    if metadata_only or candidates:
+        items, remaining = select_candidates(items, candidates)
+        results.extend(
+            f"-,{fsize},{mtime},{ino},{fpath}" for fpath, fsize, mtime, ino in remaining
+        )
+    records, hash_errors = hash_inodes(
+        items,
+        max_workers=settings.get("workers"),
+        chunksize=settings.get("chunksize") or 10,
+    )
+    errors.extend(hash_errors)
+    results.extend(records)
+    if cache is not None:
+        for record in records:
+            cache.update(record)
+    # sorted by path, so snap-shots can be compared by streaming (ptool diff)
+    results[1:] = sorted(results[1:], key=lambda record: record.split(",", 4)[-1])
     results = "\n".join(results)
     if errors:
         nerrors = len(errors)
         errorstr = "\n".join([e.result() for e in errors])
         echo(errorstr)
         echo(f"Found {nerrors} Errors out of {nfiles} Files")
-    echo(f"Writing results to {outfile.name}")
-    outfile.writelines(results)
+    outname = "<stdout>" if outfile == "-" else outfile
+    echo(f"Writing results to {outname}")
+    with open_outfile(outfile, compression) as fid:
+        fid.write(results)
+    if cache is not None:
+        echo(f"Writing scan cache to {cache_file}")
+        cache.save(cache_file)
+    if digests:
+        if outfile == "-":
+            echo("Directory digests are only written along with -o/--outfile")
+        else:
+            from .digests import main as write_digests
+
+            echo(f"Writing directory digests to {write_digests(outfile)}")
 
 
 @click.command()
@@ -228,10 +653,77 @@ def main(path, outfile, ignore=None, ignore_dirs=None, drop_hidden_files=True):
     "--ignore-dirs", default=None, show_default=True, help="ignore directories"
 )
 @click.option(
-    "-o", "--outfile", type=click.File("w"), default="-", help="output filename"
+    "--exclude",
+    default=None,
+    help="filter expression (path/name globs, size and time rules)",
+)
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(allow_dash=True),
+    default="-",
+    help="output filename",
+)
+@click.option(
+    "--compress",
+    "compression",
+    type=click.Choice(["gzip", "zstd"]),
+    default=None,
+    help="compress output (default: inferred from .gz/.zst extension, "
+    "which it must match)",
+)
+@click.option(
+    "--metadata-only",
+    is_flag=True,
+    default=False,
+    help="only gather file size and mtime, no checksums",
+)
+@click.option(
+    "--candidates",
+    default=None,
+    type=click.Path(exists=True),
+    help="only hash files whose size or name occurs in this checksum file",
+)
+@click.option(
+    "--profile",
+    default=None,
+    help="site profile from ptool_config.yaml (default: by hostname)",
+)
+@click.option(
+    "--cache",
+    "cache_file",
+    default=None,
+    type=click.Path(),
+    help="scan cache of previous run (created if missing)",
+)
+@click.option(
+    "--restat/--no-restat",
+    default=True,
+    show_default=True,
+    help="stat files in unchanged directories to catch in-place modifications",
+)
+@click.option(
+    "--digests",
+    is_flag=True,
+    default=False,
+    help="also write directory digests next to outfile (see compare --tree)",
 )
 @click.argument("path")
-def cli(path, outfile, ignore, ignore_dirs, drop_hidden_files):
+def cli(
+    path,
+    outfile,
+    compression,
+    ignore,
+    ignore_dirs,
+    exclude,
+    drop_hidden_files,
+    metadata_only,
+    candidates,
+    profile,
+    cache_file,
+    restat,
+    digests,
+):
     """path to file or folder.
 
     Calculates imohash checksum of file(s) at the given path.
@@ -244,6 +736,14 @@ def cli(path, outfile, ignore, ignore_dirs, drop_hidden_files):
         ignore=ignore,
         ignore_dirs=ignore_dirs,
         drop_hidden_files=drop_hidden_files,
+        cache_file=cache_file,
+        restat=restat,
+        compression=compression,
+        exclude=exclude,
+        metadata_only=metadata_only,
+        candidates=candidates,
+        profile=profile,
+        digests=digests,
     )
 
 
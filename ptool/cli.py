@@ -1,6 +1,8 @@
 import os
 import uuid
 import click
+import humanize
+from click.core import ParameterSource
 
 
 disclaimer = """
@@ -17,9 +19,45 @@ disclaimer = """
 
 
 @click.group()
-def cli():
+@click.option(
+    "--memory-report",
+    is_flag=True,
+    default=False,
+    help="report memory usage of each analysis stage",
+)
+@click.option(
+    "--max-name-join",
+    type=click.IntRange(min=0),
+    default=None,
+    help="rows of the join on file name before common names are only "
+    "matched within associated directories  [default: 10000000]",
+)
+def cli(memory_report, max_name_join):
     """Ptool is a cross-site pool management tool"""
-    pass
+    if memory_report or (max_name_join is not None):
+        from . import analyse
+
+        analyse.REPORT_MEMORY = memory_report
+        if max_name_join is not None:
+            analyse.MAX_NAME_JOIN = max_name_join
+
+
+def relative_subtree(ctx, param, value):
+    """checks that --subtree is a relative path.
+
+    Both sites are mounted under different prefixes, so the same absolute
+    path would not select the same files at both sites."""
+    if value is None:
+        return value
+    subtree = os.path.normpath(value)
+    if os.path.isabs(subtree) or subtree.split(os.path.sep)[0] in (
+        os.curdir,
+        os.pardir,
+    ):
+        raise click.BadParameter(
+            f"{value} is not a path relative to the pool (e.g. LR/exp1)"
+        )
+    return subtree
 
 
 @cli.command()
@@ -33,6 +71,10 @@ def cli():
     help="displays full path instead of relative path",
 )
 @click.option("--ignore", help="ignores directory and files")
+@click.option(
+    "--exclude",
+    help="filter expression (path/name globs, size and time rules)",
+)
 @click.option(
     "-t",
     "--threshold",
@@ -40,9 +82,31 @@ def cli():
     show_default=True,
     help="minumin value to satisfy valid association",
 )
+@click.option(
+    "-j",
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="processes comparing top-level directories in parallel",
+)
+@click.option(
+    "--tree",
+    is_flag=True,
+    default=False,
+    help="associate identical sub-trees by directory digests first",
+)
+@click.option(
+    "--subtree",
+    default=None,
+    callback=relative_subtree,
+    help="only load files below directories of this relative path (e.g. LR/exp1)",
+)
 @click.argument("left", required=True, type=click.Path())
 @click.argument("right", required=True, type=click.Path())
-def compare(outfile, fullpath, ignore, threshold, left, right):
+def compare(
+    outfile, fullpath, ignore, exclude, threshold, workers, tree, subtree, left, right
+):
     """Compare csv files containing checksum to infer the status of data
     in these data pools. The results include, synced files at both HPC sites. unsynced files.
     directory mapping of synced files. filename mis-matches.
@@ -53,12 +117,23 @@ def compare(outfile, fullpath, ignore, threshold, left, right):
     """
     from .analyse import read_csv, compare_compact
 
-    ld, ld_dups = read_csv(left, ignore=ignore)
-    lr, lr_dups = read_csv(right, ignore=ignore)
+    try:
+        ld, ld_dups = read_csv(left, ignore=ignore, exclude=exclude, subtree=subtree)
+        lr, lr_dups = read_csv(right, ignore=ignore, exclude=exclude, subtree=subtree)
+    except ValueError as e:
+        raise click.ClickException(str(e))
     columns = "rpath"
     if fullpath:
         columns = "fpath"
-    res = compare_compact(ld, lr, columns=columns, threshold=threshold, relabel=False)
+    res = compare_compact(
+        ld,
+        lr,
+        columns=columns,
+        threshold=threshold,
+        relabel=False,
+        workers=workers,
+        tree=tree,
+    )
     if "stdout" in outfile.name:
         click.echo(res)
     else:
@@ -69,6 +144,10 @@ def compare(outfile, fullpath, ignore, threshold, left, right):
 
 @cli.command()
 @click.option("--ignore", help="ignores directory and files")
+@click.option(
+    "--exclude",
+    help="filter expression (path/name globs, size and time rules)",
+)
 @click.option(
     "--drop-duplicates",
     is_flag=True,
@@ -90,25 +169,139 @@ def compare(outfile, fullpath, ignore, threshold, left, right):
     show_default=True,
     help="minumin value to satisfy valid association",
 )
+@click.option(
+    "--sample",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=None,
+    help="estimate summary from given fraction of directories",
+)
+@click.option("--seed", type=int, default=None, help="random seed for --sample")
+@click.option(
+    "-j",
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="processes comparing top-level directories in parallel",
+)
+@click.option(
+    "--tree",
+    is_flag=True,
+    default=False,
+    help="associate identical sub-trees by directory digests first",
+)
+@click.option(
+    "--subtree",
+    default=None,
+    callback=relative_subtree,
+    help="only load files below directories of this relative path (e.g. LR/exp1)",
+)
 @click.argument("left", required=True, type=click.Path())
 @click.argument("right", required=True, type=click.Path())
-def summary(ignore, drop_duplicates, compact, threshold, left, right):
+@click.pass_context
+def summary(
+    ctx,
+    ignore,
+    exclude,
+    drop_duplicates,
+    compact,
+    threshold,
+    sample,
+    seed,
+    workers,
+    tree,
+    subtree,
+    left,
+    right,
+):
     """Prints a short summary by analysing csv files.
 
+    With `--sample`, only the given fraction of directories of LEFT (sampled
+    per top-level directory) is compared and the number of identical,
+    renamed, modified and unique files and their sizes are estimated along
+    with 95% confidence intervals.
+
     LEFT: csv file containing checksums of all files in the pool for a given project and HPC site.
 
-    RIGHT: similar file as LEFT but from different HPC site for the same project.
+    RIGHT: similar file as LEFT but from different HPC site for the same project,
+    or a sketch of it (see `ptool sketch`) to only find the files certainly
+    missing at the other site.
     """
-    from .analyse import summary
-
-    summary(
-        left,
-        right,
-        ignore=ignore,
-        compact=compact,
-        drop_duplicates=drop_duplicates,
-        threshold=threshold,
-    )
+    from .analyse import summary, summary_estimate
+    from . import sketch
+
+    if sketch.is_sketch(right):
+        reject_with_sketch(
+            ctx,
+            "drop_duplicates",
+            "compact",
+            "threshold",
+            "sample",
+            "seed",
+            "workers",
+            "tree",
+        )
+        try:
+            sketch.summary(
+                left, right, ignore=ignore, exclude=exclude, subtree=subtree
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        return
+    if sample:
+        if compact:
+            raise click.UsageError(
+                "--compact shortens the per directory table, which is not "
+                "shown with --sample"
+            )
+        try:
+            summary_estimate(
+                left,
+                right,
+                ignore=ignore,
+                fraction=sample,
+                threshold=threshold,
+                seed=seed,
+                exclude=exclude,
+                subtree=subtree,
+                drop_duplicates=drop_duplicates,
+                workers=workers,
+                tree=tree,
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        return
+    try:
+        summary(
+            left,
+            right,
+            ignore=ignore,
+            compact=compact,
+            drop_duplicates=drop_duplicates,
+            threshold=threshold,
+            exclude=exclude,
+            workers=workers,
+            tree=tree,
+            subtree=subtree,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+def reject_with_sketch(ctx, *names):
+    "raises UsageError for the given options, if set, as RIGHT is a sketch"
+    given = [
+        max(param.opts, key=len)
+        for param in ctx.command.params
+        if param.name in names
+        and ctx.get_parameter_source(param.name)
+        not in (ParameterSource.DEFAULT, ParameterSource.DEFAULT_MAP)
+    ]
+    if given:
+        raise click.UsageError(
+            f"{', '.join(given)} cannot be used when RIGHT is a sketch, which "
+            "only tells the files certainly missing at the other site"
+        )
 
 
 def sanitise(host, path):
@@ -122,7 +315,19 @@ def sanitise(host, path):
 @click.option(
     "-o", "--outfile", type=click.File("w"), default="sync_cmd.sh", help="file to write results"
 )
+@click.option(
+    "-m",
+    "--manifest",
+    type=click.Path(),
+    default="sync_manifest.csv",
+    show_default=True,
+    help="file to write the list of transferred files (see verify-transfer)",
+)
 @click.option("--ignore", help="ignores directory and files")
+@click.option(
+    "--exclude",
+    help="filter expression (path/name globs, size and time rules)",
+)
 @click.option(
     "--flags",
     "Flag",
@@ -149,11 +354,55 @@ def sanitise(host, path):
     default="",
     help="username@host prefix to the path for right file",
 )
+@click.option(
+    "-j",
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="processes comparing top-level directories in parallel",
+)
+@click.option(
+    "--tree",
+    is_flag=True,
+    default=False,
+    help="associate identical sub-trees by directory digests first",
+)
+@click.option(
+    "--subtree",
+    default=None,
+    callback=relative_subtree,
+    help="only load files below directories of this relative path (e.g. LR/exp1)",
+)
 @click.argument("left", required=True, type=click.Path())
 @click.argument("right", required=True, type=click.Path())
-def prepare_rsync(outfile, ignore, Flag, threshold, lefthost, righthost, left, right):
+@click.pass_context
+def prepare_rsync(
+    ctx,
+    outfile,
+    manifest,
+    ignore,
+    exclude,
+    Flag,
+    threshold,
+    lefthost,
+    righthost,
+    workers,
+    tree,
+    subtree,
+    left,
+    right,
+):
     """Prepares rsync commands for the transfer.
 
+    RIGHT may also be a sketch of the other site (see `ptool sketch`). Then
+    only the files of LEFT certainly missing at the other site are
+    transferred, to the same relative paths under its pool.
+
+    Source, destination, expected checksum and size of each transferred file
+    are written to `--manifest`. After the transfer, run `ptool
+    verify-transfer` with it on the destination to check just these files.
+
     Denpending on where data needs to pushed or pulled, provide
     either `--lefthost` or `--righthost` information to prefix that path.
 
@@ -191,6 +440,12 @@ def prepare_rsync(outfile, ignore, Flag, threshold, lefthost, righthost, left, r
 
        ptool prepare-rsync --lefthost user@albedo0.dmawi.de checksum_albedo_fesom2.csv checksum_levante_fesom2.csv
     """
+    from .sketch import Sketch, is_sketch, unique_files
+
+    if is_sketch(right):
+        # only unique files are found with a sketch
+        flags = ["Flag"] if Flag != "unique" else []
+        reject_with_sketch(ctx, "threshold", "workers", "tree", *flags)
     if Flag == "both":
         Flag = {"unique", "modified_latest_left", "modified_latest_right"}
     elif Flag == "modified":
@@ -200,20 +455,45 @@ def prepare_rsync(outfile, ignore, Flag, threshold, lefthost, righthost, left, r
             "unique",
         }
 
-    from .analyse import read_csv, compare, directory_map, merge
+    from .analyse import read_csv, compare, directory_map, merge, add_paths, add_checksums
+    from .verify import write_manifest
 
-    ld, ld_dups = read_csv(left, ignore=ignore)
-    rd, rd_dups = read_csv(right, ignore=ignore)
+    try:
+        ld, ld_dups = read_csv(left, ignore=ignore, exclude=exclude, subtree=subtree)
+    except ValueError as e:
+        raise click.ClickException(str(e))
     left_host = lefthost
     right_host = righthost
-    dm = dict(directory_map(merge(ld, rd)).values)
-    c = compare(ld, rd, threshold=threshold)
+    if is_sketch(right):
+        rd = Sketch.load(right)
+        dm = {}
+        try:
+            c = unique_files(ld, rd)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    else:
+        try:
+            rd, rd_dups = read_csv(
+                right, ignore=ignore, exclude=exclude, subtree=subtree
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        c = compare(ld, rd, threshold=threshold, workers=workers, tree=tree)
+        if tree:
+            # most common directory of identical and renamed files
+            m = c.loc[c.index.isin(["identical", "renamed"])]
+            m = m.groupby("rparent_left", observed=True).rparent_right
+            dm = m.agg(lambda x: x.value_counts().index[0]).to_dict()
+        else:
+            dm = dict(directory_map(merge(ld, rd, workers=workers)).values)
     fmap = {}
+    transfers = []
     syncs = ["#!/bin/bash"]
     syncs.append(disclaimer)
-    prefix_left = c.prefix_left.dropna().iloc[0]
-    prefix_right = c.prefix_right.dropna().iloc[0]
-    for name, grp in c.groupby("rparent_left"):
+    c = add_paths(c, ld.prefix, "_left")
+    prefix_left = ld.prefix
+    prefix_right = rd.prefix
+    for name, grp in c.groupby("rparent_left", observed=True):
         use_relative = True
         if name in dm:
             use_relative = False
@@ -225,8 +505,14 @@ def prepare_rsync(outfile, ignore, Flag, threshold, lefthost, righthost, left, r
         grp = grp.loc[common_flags].reset_index()
         if use_relative:
             filelist.extend(list(grp.rpath_left))
+            dst = prefix_right + grp.rpath_left
         else:
             filelist.extend(list(grp.fname_left))
+            dst = prefix_right + dm[name].rstrip(os.path.sep) + os.path.sep + grp.fname_left
+        grp = add_checksums(grp, ld.algorithm, "_left")
+        transfers.extend(
+            zip(grp.checksum_left, grp.fsize_left, grp.fpath_left, dst)
+        )
         if filelist:
             fid = str(uuid.uuid4())  # [:8]
             fmap[fid] = filelist
@@ -261,13 +547,163 @@ fi
     # syncs.append(f"rm {names}")
     syncs = "\n".join(syncs)
     # os.makedirs("flist", exist_ok=True)
-    with open(outfile, "w") as fid:
-        fid.writelines(syncs)
+    outfile.write(syncs)
     # for name, fnames in fmap.items():
     #    with open(f"flist/{name}", "w") as fid:
     #        fnames = "\n".join(fnames)
     #        fid.writelines(fnames)
-    print("Created sync_cmd.sh")
+    write_manifest(manifest, transfers)
+    print(f"Created {outfile.name} and {manifest}")
+
+
+@cli.command()
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(allow_dash=True),
+    default="-",
+    help="file to write results",
+)
+@click.option(
+    "--sort",
+    is_flag=True,
+    default=False,
+    help="sort inputs by path (needed for checksum files of older versions)",
+)
+@click.option(
+    "--buffer-lines",
+    default=1_000_000,
+    show_default=True,
+    help="lines sorted in memory at once when sorting",
+)
+@click.argument("old", required=True, type=click.Path(exists=True))
+@click.argument("new", required=True, type=click.Path(exists=True))
+def diff(outfile, sort, buffer_lines, old, new):
+    """Lists changes between two snap-shots of the same pool.
+
+    Files are flagged as added, removed, modified (same path, different
+    checksum) or moved (same checksum, different path). The snap-shots are
+    merge-joined by path while streaming, so memory usage stays constant
+    irrespective of the size of the pool (only added and removed files are
+    kept to detect moves).
+
+    OLD: earlier checksum file of the pool.
+
+    NEW: later checksum file of the same pool.
+    """
+    from . import diff
+
+    try:
+        diff.main(old, new, outfile=outfile, sort=sort, buffer_lines=buffer_lines)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command()
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(allow_dash=True),
+    default="-",
+    help="file to write files failing verification",
+)
+@click.option(
+    "--profile",
+    default=None,
+    help="site profile from ptool_config.yaml (default: by hostname)",
+)
+@click.argument("manifest", required=True, type=click.Path(exists=True))
+def verify_transfer(outfile, profile, manifest):
+    """Verifies files transferred by the script of prepare-rsync.
+
+    Only the destination files listed in MANIFEST (see `prepare-rsync
+    --manifest`) are checked, so run this on the destination machine.
+    Missing files and size mismatches are found without reading the files,
+    the others are hashed in parallel and compared to the expected
+    checksum. Exits with status 1 if any file fails verification.
+    """
+    from .verify import main
+
+    counts = main(manifest, outfile=outfile, profile=profile)
+    if sum(counts.values()) != counts["verified"]:
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(),
+    default=None,
+    help="file to write the sketch  [default: <site>.sketch]",
+)
+@click.option(
+    "--fpr",
+    type=click.FloatRange(0, 1, min_open=True, max_open=True),
+    default=0.01,
+    show_default=True,
+    help="false positive rate, i.e., missing files taken as present",
+)
+@click.option(
+    "--per-directory",
+    is_flag=True,
+    default=False,
+    help="keep a filter per top-level directory",
+)
+@click.option("--ignore", help="ignores directory and files")
+@click.option(
+    "--exclude",
+    help="filter expression (path/name globs, size and time rules)",
+)
+@click.argument("checksums", required=True, type=click.Path(exists=True))
+def sketch(outfile, fpr, per_directory, ignore, exclude, checksums):
+    """Writes a compact sketch (Bloom filter) of the checksums of a pool.
+
+    The sketch takes about 10 bits per file, a small fraction of the
+    checksum file, and is cheap to copy to the other site. There, pass it
+    as RIGHT to `summary` or `prepare-rsync` to find the local files which
+    are certainly missing at this site.
+
+    CHECKSUMS: csv file containing checksums of all files in the pool.
+    """
+    from .analyse import read_csv
+    from .sketch import Sketch
+
+    df, _ = read_csv(checksums, ignore=ignore, exclude=exclude)
+    sk = Sketch.from_snapshot(df, fpr=fpr, per_directory=per_directory)
+    outfile = outfile or f"{df.site}.sketch"
+    sk.save(outfile)
+    size = humanize.naturalsize(os.path.getsize(outfile))
+    click.echo(
+        f"Sketch of {sk.files} files in {len(sk.filters)} filter(s) written "
+        f"to {outfile} ({size})"
+    )
+
+
+@cli.command()
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(),
+    default=None,
+    help="file to write digests  [default: <checksums>.digests.csv]",
+)
+@click.argument("checksums", required=True, type=click.Path(exists=True))
+def digests(outfile, checksums):
+    """Writes Merkle digests of all directories of a checksum file.
+
+    The digest of a directory covers names and checksums of all files below
+    it, so identical sub-trees have identical digests wherever they are.
+    With `--tree`, `summary`, `compare` and `prepare-rsync` compare digests
+    top-down and only compare the files of directories that differ. The
+    digests are picked up from next to the checksum file (computed on the
+    fly otherwise), this command adds them to existing checksum files.
+
+    CHECKSUMS: csv file containing checksums of all files in the pool.
+    """
+    from .digests import main
+
+    click.echo(f"Directory digests written to {main(checksums, outfile)}")
 
 
 @cli.command()
@@ -283,21 +719,130 @@ fi
     "--ignore-dirs", default=None, show_default=True, help="ignore directories"
 )
 @click.option(
-    "-o", "--outfile", type=click.File("w"), default="-", help="output filename"
+    "--exclude",
+    default=None,
+    help="filter expression (path/name globs, size and time rules)",
+)
+@click.option(
+    "-o",
+    "--outfile",
+    type=click.Path(allow_dash=True),
+    default="-",
+    help="output filename",
+)
+@click.option(
+    "--compress",
+    "compression",
+    type=click.Choice(["gzip", "zstd"]),
+    default=None,
+    help="compress output (default: inferred from .gz/.zst extension, "
+    "which it must match)",
+)
+@click.option(
+    "--metadata-only",
+    is_flag=True,
+    default=False,
+    help="only gather file size and mtime, no checksums",
+)
+@click.option(
+    "--candidates",
+    default=None,
+    type=click.Path(exists=True),
+    help="only hash files whose size or name occurs in this checksum file",
+)
+@click.option(
+    "--profile",
+    default=None,
+    help="site profile from ptool_config.yaml (default: by hostname)",
+)
+@click.option(
+    "--cache",
+    "cache_file",
+    default=None,
+    type=click.Path(),
+    help="scan cache of previous run (created if missing)",
+)
+@click.option(
+    "--restat/--no-restat",
+    default=True,
+    show_default=True,
+    help="stat files in unchanged directories to catch in-place modifications",
+)
+@click.option(
+    "--digests",
+    is_flag=True,
+    default=False,
+    help="also write directory digests next to outfile (see compare --tree)",
 )
 @click.argument("path")
-def checksums(path, outfile, ignore, ignore_dirs, drop_hidden_files):
+def checksums(
+    path,
+    outfile,
+    compression,
+    ignore,
+    ignore_dirs,
+    exclude,
+    drop_hidden_files,
+    metadata_only,
+    candidates,
+    profile,
+    cache_file,
+    restat,
+    digests,
+):
     """Calculates imohash checksum of file(s) at the given path.
     Results are presented as csv.
 
     `--ignore` and `--ignore-dirs` support *wildcards* in filtering down the
     matches.  If no *wildcards* are provided, then it performs a literal
     match. For multiple patterns, use comma separation.
+
+    `--exclude` takes a filter expression of comma separated rules, e.g.,
+    `**/restart/*.nc,dir:dist_*,size>10G,age>365d`. Path globs are relative
+    to PATH, `**` matches any number of directories. Excluded directories
+    are not scanned at all. The same expression can be passed to the
+    analysis commands.
+
+    With `--cache`, directories whose mtime is unchanged since the previous
+    run are not re-listed and files with unchanged size and mtime are not
+    re-hashed. `--no-restat` additionally trusts files in unchanged
+    directories without checking them for in-place modifications.
+
+    Results are compressed on the fly when the output filename ends with
+    `.gz` or `.zst` or when `--compress` is given.
+
+    For a cheap two-phase comparison of sites, first gather
+    `--metadata-only` inventories (no file is read), exchange them and then
+    run with `--candidates OTHER` to hash only files whose size or name
+    occurs at the other site. The remaining files are certainly unique and
+    are recorded without checksum.
+
+    Number of workers, batch sizes, default exclusion rules and compression
+    of stdout are taken from the site profile in `ptool_config.yaml`, chosen
+    by hostname or with `--profile`.
+
+    With `--digests`, Merkle digests of all directories are written next to
+    the output file, e.g., `pool.digests.csv` for `pool.csv.zst`. The
+    analysis commands use them with `--tree` to skip identical sub-trees.
     """
     from . import checksums
 
     path = os.path.expanduser(path)
-    checksums.main(path, outfile, ignore, ignore_dirs, drop_hidden_files)
+    checksums.main(
+        path,
+        outfile,
+        ignore,
+        ignore_dirs,
+        drop_hidden_files,
+        cache_file=cache_file,
+        restat=restat,
+        compression=compression,
+        exclude=exclude,
+        metadata_only=metadata_only,
+        candidates=candidates,
+        profile=profile,
+        digests=digests,
+    )
 
 
 if __name__ == "__main__":
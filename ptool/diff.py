@@ -0,0 +1,159 @@
+"""Streaming comparison of two snap-shots of the same pool.
+
+Unlike `analyse.compare`, which associates files across sites by checksum
+and name, snap-shots of the same site share their paths. Both checksum files
+are read line by line in order of path and merge-joined, so memory usage
+does not depend on the size of the pool. Only added and removed files are
+kept in memory to pair them into moved files at the end.
+"""
+
+import csv
+import heapq
+import os
+import tempfile
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from .checksums import echo, open_infile, open_outfile
+
+FLAGS = ("added", "removed", "modified", "moved")
+
+
+def records(filename):
+    "Iterates over (fpath, checksum, fsize, mtime) of a checksum file"
+    with open_infile(filename) as fid:
+        header = next(fid).rstrip("\n").split(",")
+        ncols = len(header)
+        checksum = header.index("checksum")
+        fsize = header.index("fsize")
+        mtime = header.index("mtime")
+        for line in fid:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            fields = line.split(",", ncols - 1)
+            yield fields[-1], fields[checksum], fields[fsize], fields[mtime]
+
+
+def checked(items, filename):
+    "Passes items through, raises ValueError if they are not sorted by path"
+    last = None
+    for item in items:
+        if last is not None and item[0] < last:
+            raise ValueError(
+                f"{filename} is not sorted by path (at {item[0]}), use --sort"
+            )
+        last = item[0]
+        yield item
+
+
+def sorted_records(filename, buffer_lines=1_000_000):
+    """Iterates over records of a checksum file sorted by path.
+
+    External merge sort: runs of `buffer_lines` records are sorted in memory
+    and spilled to temporary files, which are then merged lazily."""
+    with tempfile.TemporaryDirectory(prefix="ptool-") as tmpdir, ExitStack() as stack:
+        runs = []
+        buf = []
+
+        def spill():
+            buf.sort()
+            path = os.path.join(tmpdir, str(len(runs)))
+            with open(path, "w", newline="") as fid:
+                csv.writer(fid).writerows(buf)
+            runs.append(path)
+            buf.clear()
+
+        for item in records(filename):
+            buf.append(item)
+            if len(buf) >= buffer_lines:
+                spill()
+        if not runs:
+            buf.sort()
+            yield from buf
+            return
+        if buf:
+            spill()
+        readers = [
+            map(tuple, csv.reader(stack.enter_context(open(path, newline=""))))
+            for path in runs
+        ]
+        yield from heapq.merge(*readers)
+
+
+def is_modified(old, new):
+    "compares records of the same path (size and mtime if checksum is missing)"
+    _, old_checksum, old_fsize, old_mtime = old
+    _, new_checksum, new_fsize, new_mtime = new
+    if old_checksum == "-" or new_checksum == "-":
+        return (old_fsize != new_fsize) or (float(old_mtime) != float(new_mtime))
+    return old_checksum != new_checksum
+
+
+def movable(item):
+    """True if a record can be paired into a move by its checksum.
+
+    Files without checksum are not, nor are empty files: they all share the
+    same checksum, so pairing them would report unrelated files as moved."""
+    _, checksum, fsize, _ = item
+    return checksum != "-" and int(fsize) > 0
+
+
+def changes(old, new):
+    """Merge-joins two iterators of records sorted by path.
+
+    Yields (flag, old record, new record) for added, removed and modified
+    files. Removed files whose checksum re-appears as added file are
+    reported as moved (see `movable`)."""
+    removed = defaultdict(list)
+    added = []
+    a = next(old, None)
+    b = next(new, None)
+    while (a is not None) or (b is not None):
+        if b is None or (a is not None and a[0] < b[0]):
+            removed[a[1]].append(a)
+            a = next(old, None)
+        elif a is None or b[0] < a[0]:
+            added.append(b)
+            b = next(new, None)
+        else:
+            if is_modified(a, b):
+                yield "modified", a, b
+            a = next(old, None)
+            b = next(new, None)
+    for item in added:
+        checksum = item[1]
+        if movable(item) and removed.get(checksum):
+            yield "moved", removed[checksum].pop(0), item
+        else:
+            yield "added", None, item
+    for items in removed.values():
+        for item in items:
+            yield "removed", item, None
+
+
+def main(old, new, outfile="-", sort=False, buffer_lines=1_000_000):
+    """Writes changes between two snap-shots of the same pool as csv.
+
+    Both checksum files must be sorted by path (as written by `ptool
+    checksums`) unless `sort` is set."""
+    if sort:
+        old_records = sorted_records(old, buffer_lines=buffer_lines)
+        new_records = sorted_records(new, buffer_lines=buffer_lines)
+    else:
+        old_records = checked(records(old), old)
+        new_records = checked(records(new), new)
+    counts = Counter()
+    empty = ("", "", "", "")
+    with open_outfile(outfile) as fid:
+        writer = csv.writer(fid, lineterminator="\n")
+        writer.writerow(
+            ["flag", "fpath_old", "fpath_new", "checksum_old", "checksum_new", "fsize"]
+        )
+        for flag, a, b in changes(old_records, new_records):
+            counts[flag] += 1
+            a = a or empty
+            b = b or empty
+            writer.writerow([flag, a[0], b[0], a[1], b[1], b[2] or a[2]])
+    echo(", ".join(f"{flag}: {counts[flag]}" for flag in FLAGS))
+    return counts
@@ -0,0 +1,275 @@
+"""Merkle digests of directories for comparing mostly synced pools.
+
+The digest of a directory combines names and checksums of its files with
+names and digests of its sub-directories. Identical sub-trees therefore
+have the same digest, irrespective of where they are located in the pool.
+Entries are combined by addition, so a digest does not depend on the order
+in which files are listed.
+
+Digests are written next to the checksum file (see `digests_filename`) by
+`ptool checksums --digests` or `ptool digests`, and are computed on the fly
+if no such file is found. `compare_tree` compares digests top-down and
+associates whole sub-trees at once, only files in the remaining directories
+are compared individually.
+"""
+
+import csv
+import os
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from .analyse import KEY, _mix, _with_attrs, compare, read_csv
+from .checksums import COMPRESSION_EXTENSIONS, open_infile, open_outfile
+
+HASH_KEY = "ptool-digests-v1"
+HEADER = ["digest", "files", "fsize", "dpath"]
+
+
+def digests_filename(filename):
+    "name of the digests file belonging to a checksum file"
+    root, ext = os.path.splitext(filename)
+    if ext in COMPRESSION_EXTENSIONS:
+        root, ext = os.path.splitext(root)
+    return f"{root}.digests.csv"
+
+
+def _name_hashes(names):
+    return pd.util.hash_array(np.asarray(names, dtype=object), hash_key=HASH_KEY)
+
+
+def _combine(names, key_hi, key_lo):
+    "hashes of (name, key) entries, to be summed up per directory"
+    h = _name_hashes(names)
+    return _mix(key_hi ^ h), _mix(key_lo + h)
+
+
+def directory_digests(df):
+    """Digests of all directories of a snap-shot (as read by `read_csv`).
+
+    Returns a frame indexed by directory relative to the prefix (like
+    `rparent`) with `digest_hi`, `digest_lo`, `known`, `files` and `fsize`
+    columns; the latter two count all files below the directory. Digests
+    of directories containing files without checksum are not `known`.
+    """
+    categories = list(df.rparent.cat.categories)
+    dirs = set()
+    for path in categories:
+        while path not in dirs:
+            dirs.add(path)
+            if path == os.path.sep:
+                break
+            path = os.path.dirname(path)
+    dirs = sorted(dirs)
+    index = {path: i for i, path in enumerate(dirs)}
+    n = len(dirs)
+    rows = np.array([index[path] for path in categories], dtype=np.int64)
+    rows = rows[df.rparent.cat.codes.to_numpy()]
+    key_hi = df.key_hi.to_numpy(dtype=np.uint64)
+    key_lo = df.key_lo.to_numpy(dtype=np.uint64)
+    digest_hi = np.zeros(n, dtype=np.uint64)
+    digest_lo = np.zeros(n, dtype=np.uint64)
+    entry_hi, entry_lo = _combine(df.fname, key_hi, key_lo)
+    np.add.at(digest_hi, rows, entry_hi)
+    np.add.at(digest_lo, rows, entry_lo)
+    files = np.bincount(rows, minlength=n).astype(np.int64)
+    fsize = np.zeros(n, dtype=np.int64)
+    np.add.at(fsize, rows, df.fsize.to_numpy(dtype=np.int64))
+    unknown = np.bincount(rows[~df.hashed.to_numpy(dtype=bool)], minlength=n) > 0
+    # propagate from the deepest directories up to the root
+    depth = np.array([p.rstrip(os.path.sep).count(os.path.sep) for p in dirs])
+    parent = np.array([index[os.path.dirname(p)] if p != os.path.sep else -1 for p in dirs])
+    names = [os.path.basename(p) + os.path.sep for p in dirs]
+    for level in range(depth.max(initial=0), 0, -1):
+        idx = np.flatnonzero(depth == level)
+        entry_hi, entry_lo = _combine(
+            [names[i] for i in idx], digest_hi[idx], digest_lo[idx]
+        )
+        np.add.at(digest_hi, parent[idx], entry_hi)
+        np.add.at(digest_lo, parent[idx], entry_lo)
+        np.add.at(files, parent[idx], files[idx])
+        np.add.at(fsize, parent[idx], fsize[idx])
+        np.logical_or.at(unknown, parent[idx], unknown[idx])
+    return pd.DataFrame(
+        {
+            "digest_hi": digest_hi,
+            "digest_lo": digest_lo,
+            "known": ~unknown,
+            "files": files,
+            "fsize": fsize,
+        },
+        index=pd.Index(dirs, name="rparent"),
+    )
+
+
+def write_digests(filename, digests, prefix):
+    "Writes digests with absolute directory paths as csv"
+    with open_outfile(filename) as fid:
+        writer = csv.writer(fid, lineterminator="\n")
+        writer.writerow(HEADER)
+        for rparent, row in zip(digests.index, digests.itertuples()):
+            digest = f"{row.digest_hi:016x}{row.digest_lo:016x}" if row.known else "-"
+            dpath = prefix + rparent.rstrip(os.path.sep)
+            writer.writerow([digest, row.files, row.fsize, dpath or os.path.sep])
+
+
+def read_digests(filename, prefix):
+    "Reads digests of directories below `prefix` (see `directory_digests`)"
+    rows = []
+    with open_infile(filename) as fid:
+        for digest, files, fsize, dpath in csv.reader(fid):
+            if dpath == "dpath":
+                continue
+            if dpath != prefix and not dpath.startswith(prefix + os.path.sep):
+                continue
+            known = digest != "-"
+            digest = digest if known else "0" * 32
+            rows.append(
+                (
+                    dpath[len(prefix) :] or os.path.sep,
+                    np.uint64(int(digest[:16], 16)),
+                    np.uint64(int(digest[16:], 16)),
+                    known,
+                    int(files),
+                    int(fsize),
+                )
+            )
+    df = pd.DataFrame(
+        rows, columns=["rparent", "digest_hi", "digest_lo", "known", "files", "fsize"]
+    )
+    return df.set_index("rparent")
+
+
+def load_digests(df):
+    """Digests of a snap-shot, from its digests file if it is up-to-date.
+
+    The file is only used if it is newer than the checksum file and accounts
+    for exactly the files of `df` (i.e., no files were filtered out)."""
+    filename = getattr(df, "filename", None)
+    if filename:
+        path = digests_filename(filename)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(
+            filename
+        ):
+            digests = read_digests(path, df.prefix)
+            if os.path.sep in digests.index:
+                if digests.files[os.path.sep] == df.shape[0]:
+                    return digests
+    return directory_digests(df)
+
+
+def matching_subtrees(left, right):
+    """Pairs of identical sub-trees, comparing digests top-down.
+
+    Starting at the root of `left`, a directory whose digest is found in
+    `right` is paired with it (preferring the same relative path) and its
+    sub-directories are skipped. Otherwise the search descends into its
+    sub-directories. Returns a dict of left -> right directories."""
+    candidates = defaultdict(list)
+    known = right[right.known]
+    for rparent, hi, lo in zip(known.index, known.digest_hi, known.digest_lo):
+        candidates[(hi, lo)].append(rparent)
+    children = defaultdict(list)
+    for rparent in left.index:
+        if rparent != os.path.sep:
+            children[os.path.dirname(rparent)].append(rparent)
+    pairs = {}
+    todo = [os.path.sep] if os.path.sep in left.index else []
+    while todo:
+        rparent = todo.pop()
+        row = left.loc[rparent]
+        matches = candidates.get((row.digest_hi, row.digest_lo)) if row.known else None
+        if matches:
+            pairs[rparent] = rparent if rparent in matches else min(matches, key=len)
+        else:
+            todo.extend(children[rparent])
+    return pairs
+
+
+def _map_subtrees(rparent, pairs):
+    """Maps directories below paired sub-trees to the paired directories.
+
+    Returns the mapped directory per category of `rparent` (None if the
+    directory is not part of a paired sub-tree)."""
+    mapped = []
+    for path in rparent.cat.categories:
+        root = path
+        while root not in pairs and root != os.path.sep:
+            root = os.path.dirname(root)
+        if root not in pairs:
+            mapped.append(None)
+            continue
+        rest = path[len(root) :] if root != os.path.sep else path
+        target = pairs[root].rstrip(os.path.sep) + rest.rstrip(os.path.sep)
+        mapped.append(target or os.path.sep)
+    return np.asarray(mapped, dtype=object)
+
+
+def _identical(left, right, targets):
+    "compare results (identical files) of left files in paired sub-trees"
+    df = left.assign(_target=targets)
+    other = right.assign(_target=right.rparent.astype("string").astype(object))
+    other = other.drop(columns="rparent").rename(
+        columns={c: f"{c}_right" for c in right.columns if c != "rparent"}
+    )
+    df = df.assign(_target=df._target.astype(object), _fname=df.fname.astype(object))
+    other = other.assign(_fname=other.fname_right.astype(object))
+    m = pd.merge(df, other, on=["_target", "_fname"], how="left")
+    # files not listed on the right (i.e., filtered out) are taken as is
+    for k in KEY + ["hashed", "fname"]:
+        m[f"{k}_right"] = m[f"{k}_right"].fillna(m[k])
+    m["hashed_right"] = m.hashed_right.astype(bool)
+    m["rparent_right"] = pd.Categorical(
+        m._target, categories=right.rparent.cat.categories
+    )
+    m = m.rename(columns={c: f"{c}_left" for c in left.columns})
+    m["flag"] = "identical"
+    m = m.set_index("flag")
+    cols = [f"{c}_left" for c in left.columns]
+    cols += [f"{c}_right" for c in left.columns if c not in KEY]
+    cols += [f"{k}_right" for k in KEY]
+    m = m[cols]
+    for col in [f"{k}_right" for k in KEY]:
+        m[col] = m[col].astype("UInt64")
+    return m
+
+
+def compare_tree(left, right, threshold=0.1, workers=1):
+    """`compare`, associating identical sub-trees by their digests.
+
+    Files of paired sub-trees (see `matching_subtrees`) are flagged as
+    identical without joining them, only the remaining files are compared
+    with `compare`. When both pools are mostly in sync, this leaves little
+    to compare.
+
+    The remaining files are compared with all files of `right`, as they are
+    by `compare`, but not associated with directories of paired sub-trees:
+    those are taken by their identical directory of `left`."""
+    pairs = matching_subtrees(load_digests(left), load_digests(right))
+    mapped = _map_subtrees(left.rparent, pairs)
+    targets = mapped[left.rparent.cat.codes.to_numpy()]
+    covered = pd.notna(targets)
+    right_roots = {target: target for target in pairs.values()}
+    right_covered = pd.notna(_map_subtrees(right.rparent, right_roots))
+    right_covered = right_covered[right.rparent.cat.codes.to_numpy()]
+    paired = None
+    if covered.any():
+        paired = _identical(left[covered], right[right_covered], targets[covered])
+        if covered.all():
+            return paired
+    return compare(
+        _with_attrs(left[~covered], left),
+        right,
+        threshold=threshold,
+        workers=workers,
+        paired=paired,
+    )
+
+
+def main(filename, outfile=None):
+    "Writes digests of the directories of a checksum file"
+    df, _ = read_csv(filename)
+    outfile = outfile or digests_filename(filename)
+    write_digests(outfile, directory_digests(df), df.prefix)
+    return outfile
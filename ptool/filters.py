@@ -0,0 +1,223 @@
+"""Filter expressions excluding files and directories.
+
+The same expression is applied while scanning (`checksums`), where excluded
+directories are pruned, and when loading checksum files for analysis.
+"""
+
+import operator
+import os
+import re
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+
+def split(s: str, sep: str = ",", escape: str = "\\") -> List[Optional[str]]:
+    r"""Split the string with respect to `sep` character
+
+    To preserve `sep` character in the string at certain places, prefix it with
+    escape character. The default escape character is "\\" but it can also
+    replaced with some other character if it is required. See examples.
+
+    Examples:
+
+    >>> split("core1,core2")
+    ["core1", "core2"]
+    >>> split("core1\,group,core2")
+    ["core1,group", "core2"]
+    >>> split("a,b\,c,d")
+    ['a', 'b,c', 'd']
+    >>> split("a|b\|c|d", sep="|")
+    ['a', 'b|c', 'd']
+    >>> split("a|b#|c|d", sep="|", escape="#")
+    ['a', 'b|c', 'd']
+    """
+    if not s:
+        return []
+    empty = ""
+    result = []
+    tmp = []
+    for part in s.split(sep):
+        if escape in part:
+            tmp.append(part.replace(escape, empty))
+        else:
+            if tmp:
+                tmp.append(part)
+                result.append(f"{sep}".join(tmp))
+                tmp.clear()
+            else:
+                result.append(part)
+    return result
+
+
+def _translate_glob(pattern: str) -> str:
+    """Translates a glob pattern into regular expression.
+
+    Unlike `fnmatch.translate`, wildcards do not match path separators and
+    a `**` path component matches any number of directories."""
+    parts = pattern.strip("/").split("/")
+    res = []
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == "**":
+            res.append(".*" if last else "(?:.*/)?")
+            continue
+        j, n = 0, len(part)
+        while j < n:
+            c = part[j]
+            j += 1
+            if c == "*":
+                res.append("[^/]*")
+            elif c == "?":
+                res.append("[^/]")
+            elif c == "[":
+                k = j
+                if k < n and part[k] == "!":
+                    k += 1
+                if k < n and part[k] == "]":
+                    k += 1
+                k = part.find("]", k)
+                if k < 0:
+                    res.append("\\[")
+                    continue
+                chars = part[j:k].replace("\\", "\\\\")
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                elif chars.startswith("^"):
+                    chars = "\\" + chars
+                res.append(f"[{chars}]")
+                j = k + 1
+            else:
+                res.append(re.escape(c))
+        if not last:
+            res.append("/")
+    return "".join(res)
+
+
+SIZE_UNITS = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30, "t": 2**40, "p": 2**50}
+AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+}
+_predicate_re = re.compile(r"^(size|mtime|age)\s*(<=|>=|<|>|=)\s*(.+)$")
+
+
+class Filter:
+    """Compiled filter to exclude files and directories.
+
+    A filter is made of rules, an entry is excluded if any rule matches it.
+
+        *.tmp              basename glob (files and directories)
+        **/restart/*.nc    path glob relative to the scanned path (has a "/")
+        file:*.log         glob restricted to files
+        dir:dist_*         glob restricted to directories (prunes subtree)
+        size>10G           file size (units k, M, G, T are powers of 1024)
+        mtime<2020-01-01   modification time (ISO date or datetime)
+        age>30d            time since modification (units s, m, h, d, w)
+
+    Globs without *wildcards* match literally. As a string, rules are comma
+    separated (see `split` for escaping commas). All globs of a kind are
+    compiled into a single regular expression.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        globs = {"file_names": [], "file_paths": [], "dir_names": [], "dir_paths": []}
+        self.predicates = []
+        now = time.time()
+        for rule in self.rules:
+            rule = rule.strip()
+            if not rule:
+                continue
+            m = _predicate_re.match(rule)
+            if m:
+                self.predicates.append(self._predicate(*m.groups(), now=now))
+                continue
+            kinds = ("file", "dir")
+            kind, sep, pattern = rule.partition(":")
+            if sep and kind in kinds:
+                kinds = (kind,)
+            else:
+                pattern = rule
+            target = "paths" if "/" in pattern.strip("/") else "names"
+            for kind in kinds:
+                globs[f"{kind}_{target}"].append(_translate_glob(pattern))
+        for name, pats in globs.items():
+            regex = re.compile("|".join(pats)).fullmatch if pats else None
+            setattr(self, name, regex)
+
+    @classmethod
+    def parse(cls, expression: str = None) -> "Filter":
+        "compiles comma separated filter expression"
+        return cls(split(expression))
+
+    @staticmethod
+    def _predicate(field, op, value, now):
+        value = value.strip()
+        if field == "size":
+            m = re.match(r"^(\d+(?:\.\d+)?)\s*([kmgtp]?)i?b?$", value, re.IGNORECASE)
+            if not m:
+                raise ValueError(f"invalid size: {value}")
+            number, unit = m.groups()
+            return ("size", OPERATORS[op], float(number) * SIZE_UNITS[unit.lower()])
+        if field == "mtime":
+            return ("mtime", OPERATORS[op], datetime.fromisoformat(value).timestamp())
+        m = re.match(r"^(\d+(?:\.\d+)?)\s*([smhdw])$", value)
+        if not m:
+            raise ValueError(f"invalid age: {value}")
+        number, unit = m.groups()
+        # older than `age` means modified before `now - age`
+        flipped = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "=": "="}
+        return ("mtime", OPERATORS[flipped[op]], now - float(number) * AGE_UNITS[unit])
+
+    def __bool__(self):
+        return bool(
+            self.file_names
+            or self.file_paths
+            or self.dir_names
+            or self.dir_paths
+            or self.predicates
+        )
+
+    def excludes_dir(self, relpath: str) -> bool:
+        "checks directory given by its path relative to the scanned path"
+        if self.dir_names and self.dir_names(os.path.basename(relpath)):
+            return True
+        return bool(self.dir_paths and self.dir_paths(relpath))
+
+    def excludes_tree(self, relpath: str) -> bool:
+        "checks directory and all its parent directories"
+        parts = relpath.strip("/").split("/")
+        return any(
+            self.excludes_dir("/".join(parts[: i + 1]))
+            for i in range(len(parts))
+            if parts[i]
+        )
+
+    def excludes_file(self, relpath: str, stat: Callable = None) -> bool:
+        """checks file given by its path relative to the scanned path.
+
+        `stat` is only called if size or time rules are present."""
+        if self.file_names and self.file_names(os.path.basename(relpath)):
+            return True
+        if self.file_paths and self.file_paths(relpath):
+            return True
+        if self.predicates and stat is not None:
+            st = stat()
+            values = {"size": st.st_size, "mtime": st.st_mtime}
+            for field, op, value in self.predicates:
+                if op(values[field], value):
+                    return True
+        return False
+
+
+def make_filter(exclude=None, ignore=None, ignore_dirs=None) -> Filter:
+    "Combines filter expression with legacy `ignore` and `ignore_dirs` patterns"
+    rules = split(exclude)
+    rules.extend(f"file:{pat}" for pat in split(ignore))
+    rules.extend(f"dir:{pat}" for pat in split(ignore_dirs))
+    return Filter(rules)
@@ -0,0 +1,234 @@
+"""Compact probabilistic summaries (sketches) of snap-shots.
+
+A sketch is a Bloom filter of the checksums of a snap-shot, about 10 bits per
+file instead of the full record, so it is cheap to copy between sites.
+Testing the local snap-shot against the sketch of the other site tells which
+files are certainly missing over there. Files reported as present are
+missing with a probability of at most the false positive rate of the sketch.
+
+With `per_directory`, a filter is kept for each top-level directory, which
+tells in addition where files are likely found at the other site.
+"""
+
+import json
+import math
+import os
+import zipfile
+
+import humanize
+import numpy as np
+import pandas as pd
+
+from .analyse import _mix, _top_level, read_csv
+
+CHUNK = 1 << 20
+
+
+class BloomFilter:
+    "Bloom filter of 128 bit checksum keys (`key_hi`, `key_lo`)"
+
+    def __init__(self, nbits, nhashes, bits=None):
+        self.nbits = int(nbits)
+        self.nhashes = int(nhashes)
+        if bits is None:
+            bits = np.zeros(self.nbits, dtype=bool)
+        self.bits = bits
+
+    @classmethod
+    def for_capacity(cls, n, fpr=0.01):
+        "filter of optimal size for `n` keys and given false positive rate"
+        n = max(n, 1)
+        nbits = math.ceil(-n * math.log(fpr) / math.log(2) ** 2)
+        nhashes = max(1, round(nbits / n * math.log(2)))
+        return cls(nbits, nhashes)
+
+    def _positions(self, key_hi, key_lo):
+        "bit positions (one row per hash function) by double hashing"
+        h1 = _mix(key_lo)
+        h2 = _mix(key_hi ^ key_lo) | np.uint64(1)
+        i = np.arange(self.nhashes, dtype=np.uint64)[:, None]
+        return (h1 + i * h2) % np.uint64(self.nbits)
+
+    def add(self, key_hi, key_lo):
+        for start in range(0, len(key_lo), CHUNK):
+            stop = start + CHUNK
+            self.bits[self._positions(key_hi[start:stop], key_lo[start:stop])] = True
+
+    def contains(self, key_hi, key_lo):
+        "boolean array, False if the key was certainly not added"
+        found = np.zeros(len(key_lo), dtype=bool)
+        for start in range(0, len(key_lo), CHUNK):
+            stop = start + CHUNK
+            positions = self._positions(key_hi[start:stop], key_lo[start:stop])
+            found[start:stop] = self.bits[positions].all(axis=0)
+        return found
+
+    def pack(self):
+        return np.packbits(self.bits, bitorder="little")
+
+    @classmethod
+    def unpack(cls, nbits, nhashes, packed):
+        bits = np.unpackbits(packed, count=nbits, bitorder="little").view(bool)
+        return cls(nbits, nhashes, bits)
+
+
+def _keys(df):
+    "checksum keys of a snap-shot as uint64 arrays, skipping unhashed files"
+    hashed = df.hashed.to_numpy(dtype=bool)
+    key_hi = df.key_hi.to_numpy(dtype=np.uint64)[hashed]
+    key_lo = df.key_lo.to_numpy(dtype=np.uint64)[hashed]
+    return hashed, key_hi, key_lo
+
+
+class Sketch:
+    """Bloom filters of the checksums of a snap-shot.
+
+    `filters` maps top-level directories to their filter; a single filter
+    of the whole pool is stored under "" unless `per_directory` was used.
+    """
+
+    def __init__(self, filters, site="", prefix="", algorithm="", files=0, fpr=0.01):
+        self.filters = filters
+        self.site = site
+        self.prefix = prefix
+        self.algorithm = algorithm
+        self.files = files
+        self.fpr = fpr
+
+    @classmethod
+    def from_snapshot(cls, df, fpr=0.01, per_directory=False):
+        """Sketch of a snap-shot as read by `read_csv`.
+
+        Per directory filters are sized for a false positive rate of
+        `fpr / number of filters`, which keeps the rate of the whole sketch
+        at `fpr`."""
+        hashed, key_hi, key_lo = _keys(df)
+        if per_directory:
+            tops = _top_level(df.rparent)[hashed]
+            groups = pd.Series(np.arange(len(tops))).groupby(tops).indices
+        else:
+            groups = {"": np.arange(len(key_lo))}
+        filters = {}
+        for name, idx in groups.items():
+            bloom = BloomFilter.for_capacity(len(idx), fpr / len(groups))
+            bloom.add(key_hi[idx], key_lo[idx])
+            filters[name] = bloom
+        return cls(
+            filters,
+            site=df.site,
+            prefix=df.prefix,
+            algorithm=df.algorithm,
+            files=len(key_lo),
+            fpr=fpr,
+        )
+
+    def save(self, filename):
+        meta = {
+            "site": self.site,
+            "prefix": self.prefix,
+            "algorithm": self.algorithm,
+            "files": self.files,
+            "fpr": self.fpr,
+            "filters": [
+                {"directory": name, "nbits": f.nbits, "nhashes": f.nhashes}
+                for name, f in self.filters.items()
+            ],
+        }
+        arrays = {f"filter{i}": f.pack() for i, f in enumerate(self.filters.values())}
+        with open(filename, "wb") as fid:
+            np.savez(fid, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            filters = {
+                item["directory"]: BloomFilter.unpack(
+                    item["nbits"], item["nhashes"], data[f"filter{i}"]
+                )
+                for i, item in enumerate(meta.pop("filters"))
+            }
+        return cls(filters, **meta)
+
+    @property
+    def per_directory(self):
+        return list(self.filters) != [""]
+
+    def lookup(self, df):
+        """Tests files of a snap-shot against the sketch.
+
+        Returns `df` with `flag` column ("missing" if certainly not in the
+        sketched snap-shot, "present" if probably in it, "unchecked" if the
+        file has no checksum) and `match` column (top-level directory of the
+        first matching filter)."""
+        if self.algorithm and df.algorithm and (self.algorithm != df.algorithm):
+            raise ValueError(
+                f"checksum algorithms differ: {df.algorithm} vs {self.algorithm}"
+            )
+        hashed, key_hi, key_lo = _keys(df)
+        match = np.full(len(key_lo), None, dtype=object)
+        for name, bloom in self.filters.items():
+            todo = np.flatnonzero(pd.isna(match))
+            found = bloom.contains(key_hi[todo], key_lo[todo])
+            match[todo[found]] = name
+        flag = np.full(len(df), "unchecked", dtype=object)
+        flag[np.flatnonzero(hashed)] = np.where(pd.isna(match), "missing", "present")
+        matches = np.full(len(df), None, dtype=object)
+        matches[np.flatnonzero(hashed)] = match
+        return df.assign(flag=flag, match=matches)
+
+
+def is_sketch(filename):
+    "True if `filename` is a sketch written by `Sketch.save`"
+    return os.path.isfile(filename) and zipfile.is_zipfile(filename)
+
+
+def unique_files(left, sketch):
+    """Files of `left` certainly missing in the sketched snap-shot.
+
+    Same layout as the `unique` files of `analyse.compare`."""
+    df = sketch.lookup(left)
+    df = df[df.flag == "missing"].drop(columns="match")
+    df = df.assign(flag="unique").set_index("flag")
+    df.columns = [f"{c}_left" for c in df.columns]
+    return df
+
+
+def summary(filename, sketch_file, ignore=None, exclude=None, subtree=None):
+    "Prints which files of a snap-shot are missing in a remote sketch"
+    left, _ = read_csv(filename, ignore=ignore, exclude=exclude, subtree=subtree)
+    sketch = Sketch.load(sketch_file)
+    df = sketch.lookup(left)
+    hsize = lambda x: humanize.naturalsize(x)
+    order = {"missing": 1, "present": 2, "unchecked": 3}
+
+    import tabulate
+
+    print(
+        f"\nTable 1: Summary of {left.site.upper()} against sketch of "
+        f"{sketch.site.upper()}\n"
+    )
+    print(f"{left.site}: {left.shape[0]} files ({hsize(left.fsize.sum())})")
+    print(
+        f"{sketch.site}: {sketch.files} files sketched "
+        f"(false positive rate {sketch.fpr:.1%})\n"
+    )
+    rows = {}
+    for flag, grp in sorted(df.groupby("flag"), key=lambda x: order[x[0]]):
+        rows[flag] = {"files": grp.shape[0], "size": hsize(grp.fsize.sum())}
+    print(tabulate.tabulate(pd.DataFrame(rows).transpose(), headers="keys"))
+    print("-" * 70)
+    df = df.assign(top=_top_level(df.rparent))
+    r = df.groupby(["top", "flag"]).size().unstack(fill_value=0)
+    r = r[sorted(r.columns, key=order.get)]
+    r["total"] = r.sum(axis=1)
+    if sketch.per_directory:
+        present = df[df.flag == "present"]
+        r[f"{sketch.site} directory"] = present.groupby("top").match.agg(
+            lambda x: x.value_counts().index[0]
+        )
+    r.index = [os.path.sep + top for top in r.index]
+    print(f"\nTable 2: {left.site.upper()} perspective, per top-level directory\n")
+    print(tabulate.tabulate(r.fillna("-"), headers="keys"))
+    print("-" * 70)
+    return r
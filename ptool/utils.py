@@ -1,12 +1,35 @@
+import functools
 import os
 import re
 import socket
+
+import click
 import yaml
 
 BASEPATH_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH_DEFAULT = f"{BASEPATH_SCRIPTS}/ptool_config.yaml"
 
 
+@functools.lru_cache(maxsize=None)
+def load_config(config_path=CONFIG_PATH_DEFAULT):
+    """
+    Reads ``ptool_config.yaml``. The file is parsed only once, subsequent calls
+    return the cached content (which must not be modified).
+
+    Input
+    -----
+    config_path : str
+        Path to the ``ptool_config.yaml``
+
+    Returns
+    -------
+    dict
+        Content of the config file
+    """
+    with open(config_path, "r") as f:
+        return yaml.load(f, Loader=yaml.SafeLoader) or {}
+
+
 def determine_computer_from_hostname(config_path=CONFIG_PATH_DEFAULT, verbose=True):
     """
     Determines which yaml config file is needed for this computer.
@@ -28,11 +51,10 @@ def determine_computer_from_hostname(config_path=CONFIG_PATH_DEFAULT, verbose=Tr
         A string with the name of the machine as described in ``ptool_config.yaml``. If
         pattern not matched it returns ``"local"``
     """
-    with open(config_path, "r") as f:
-        all_computers = yaml.load(f, Loader=yaml.SafeLoader)
+    all_computers = load_config(config_path)
 
     for computer_name, info in all_computers.items():
-        nodes = info.get("node_names", [])
+        nodes = info.get("node_names", {})
         for computer_pattern in nodes.values():
             if isinstance(computer_pattern, str):
                 if re.match(computer_pattern, socket.gethostname()) or re.match(
@@ -55,5 +77,48 @@ def determine_computer_from_hostname(config_path=CONFIG_PATH_DEFAULT, verbose=Tr
     return "local"
 
 
+def site_profile(section, computer=None, config_path=CONFIG_PATH_DEFAULT):
+    """
+    Returns the performance profile of a ``ptool`` command for this machine.
+
+    Notes
+    -----
+    Settings given under ``profile`` of the machine override the ones given
+    under ``defaults``. Settings set to ``null`` fall back to the built-in
+    defaults of the command. Apart from ``local`` (only the ``defaults``),
+    ``computer`` must be a machine of ``ptool_config.yaml``.
+
+    Input
+    -----
+    section : str
+        Name of the command, e.g. ``"checksums"``
+    computer : str
+        Name of the machine in ``ptool_config.yaml``. Determined from the
+        hostname if not provided
+    config_path : str
+        Path to the ``ptool_config.yaml``
+
+    Returns
+    -------
+    tuple
+        Name of the machine and a dict with the settings
+    """
+    config = load_config(config_path)
+    machines = [name for name in config if name != "defaults"]
+    if computer is None:
+        computer = determine_computer_from_hostname(config_path, verbose=False)
+    elif computer != "local" and computer not in machines:
+        raise click.BadParameter(
+            f"unknown site profile {computer!r} "
+            f"(choose from: {', '.join(['local'] + machines)})",
+            param_hint="--profile",
+        )
+    profile = {}
+    for name in ("defaults", computer):
+        settings = (config.get(name) or {}).get("profile") or {}
+        profile.update(settings.get(section) or {})
+    return computer, profile
+
+
 if __name__ == "__main__":
     print(determine_computer_from_hostname())
@@ -0,0 +1,99 @@
+"""Verification of a transfer planned by `prepare-rsync`.
+
+`prepare-rsync` writes a manifest with the source path, destination path,
+expected checksum and size of every file it transfers. Instead of taking a
+new snap-shot of the whole destination pool, only the files listed in the
+manifest are checked: missing files and size mismatches are found by stat
+alone, the remaining files are hashed in parallel.
+"""
+
+import csv
+
+from .checksums import (
+    echo,
+    gather_metadata,
+    get_profile,
+    hash_inodes,
+    open_infile,
+    open_outfile,
+)
+
+MANIFEST_HEADER = ["checksum", "fsize", "src", "dst"]
+FLAGS = ("missing", "size", "checksum", "unreadable")
+
+
+def write_manifest(filename, rows):
+    "Writes (checksum, fsize, src, dst) rows as manifest"
+    with open_outfile(filename) as fid:
+        writer = csv.writer(fid, lineterminator="\n")
+        writer.writerow(MANIFEST_HEADER)
+        writer.writerows(rows)
+
+
+def read_manifest(filename):
+    "Reads manifest as a dict of destination path -> (checksum, fsize, src)"
+    entries = {}
+    with open_infile(filename) as fid:
+        for row in csv.DictReader(fid):
+            entries[row["dst"]] = (row["checksum"], int(row["fsize"]), row["src"])
+    return entries
+
+
+def failures(entries, settings=None):
+    """Checks destination files of a manifest.
+
+    Yields (flag, dst, actual checksum, actual size) for each file that does
+    not match. Files without expected checksum (`-`) are compared by size.
+    `settings` is a performance profile as used by `checksums`."""
+    settings = settings or {}
+    items, _ = gather_metadata(list(entries), max_workers=settings.get("io_depth"))
+    found = {item[0]: item for item in items}
+    for dst in entries:
+        if dst not in found:
+            yield "missing", dst, "", ""
+    candidates = []
+    for fpath, fsize, _, _ in items:
+        checksum, expected, _ = entries[fpath]
+        if fsize != expected:
+            yield "size", fpath, "", fsize
+        elif checksum != "-":
+            candidates.append(found[fpath])
+    if not candidates:
+        return
+    records, _ = hash_inodes(
+        candidates,
+        max_workers=settings.get("workers"),
+        chunksize=settings.get("chunksize") or 10,
+    )
+    hashed = set()
+    for record in records:
+        checksum, fsize, _, _, fpath = record.split(",", 4)
+        hashed.add(fpath)
+        if checksum != entries[fpath][0]:
+            yield "checksum", fpath, checksum, fsize
+    for fpath, fsize, _, _ in candidates:
+        if fpath not in hashed:
+            yield "unreadable", fpath, "", fsize
+
+
+def main(manifest, outfile="-", profile=None):
+    """Writes destination files of a manifest that failed verification as csv.
+
+    Returns counts per flag together with the number of verified files."""
+    site, settings = get_profile(profile)
+    entries = read_manifest(manifest)
+    echo(f"Verifying {len(entries)} files from {manifest} (profile: {site})")
+    counts = {flag: 0 for flag in FLAGS}
+    with open_outfile(outfile) as fid:
+        writer = csv.writer(fid, lineterminator="\n")
+        writer.writerow(
+            ["flag", "src", "dst", "checksum_expected", "checksum_actual"]
+            + ["fsize_expected", "fsize_actual"]
+        )
+        for flag, dst, checksum, fsize in failures(entries, settings):
+            counts[flag] += 1
+            expected, expected_fsize, src = entries[dst]
+            writer.writerow([flag, src, dst, expected, checksum, expected_fsize, fsize])
+    counts["verified"] = len(entries) - sum(counts.values())
+    echo(", ".join(f"{flag}: {n}" for flag, n in counts.items()))
+    return counts
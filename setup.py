@@ -23,7 +23,13 @@ setup(
         "pyarrow",
         "imohash",
         "tqdm",
+        "pyyaml",
     ],
+    package_data={"ptool": ["ptool_config.yaml"]},
+    extras_require={
+        "zstd": ["zstandard"],
+        "test": ["pytest"],
+    },
     entry_points="""
         [console_scripts]
         ptool=ptool.cli:cli
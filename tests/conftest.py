@@ -0,0 +1,107 @@
+import os
+import time
+
+import pytest
+
+from ptool.checksums import open_infile
+
+HEADER = "checksum,fsize,mtime,inode,fpath"
+
+
+def age(path, seconds=3600):
+    "sets mtime of path into the past (outside of the racy window of the cache)"
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+
+@pytest.fixture
+def make_tree(tmp_path):
+    """Creates files from a dict of relative path -> content.
+
+    All files and directories get an mtime in the past."""
+
+    def make(files, root="pool"):
+        base = tmp_path / root
+        for relpath, content in files.items():
+            fpath = base / relpath
+            fpath.parent.mkdir(parents=True, exist_ok=True)
+            fpath.write_bytes(content.encode() if isinstance(content, str) else content)
+        for dirpath, dirnames, filenames in os.walk(base, topdown=False):
+            for name in filenames:
+                age(os.path.join(dirpath, name))
+            age(dirpath)
+        return base
+
+    return make
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    """Writes a checksum file from (checksum, fsize, fpath) rows.
+
+    mtime defaults to a fixed time, inodes are unique per path."""
+
+    def write(name, rows, mtime=1_700_000_000.0):
+        lines = [HEADER]
+        for i, row in enumerate(rows):
+            checksum, fsize, fpath = row[:3]
+            t = row[3] if len(row) > 3 else mtime
+            lines.append(f"{checksum},{fsize},{t},1:{i},{fpath}")
+        path = tmp_path / name
+        path.write_text("\n".join(lines) + "\n")
+        return str(path)
+
+    return write
+
+
+def read_records(filename):
+    "checksum file (possibly compressed) as dict of fpath -> (checksum, fsize)"
+    with open_infile(filename) as fid:
+        next(fid)
+        records = {}
+        for line in fid:
+            checksum, fsize, _, _, fpath = line.rstrip("\n").split(",", 4)
+            records[fpath] = (checksum, int(fsize))
+    return records
+
+
+EMPTY = "imohash:" + "0" * 32
+
+
+@pytest.fixture
+def pools(inventory):
+    """Checksum files of two sites of a pool that are partly in sync.
+
+    Right has a moved top-level directory, renamed, modified, missing and
+    extra files, while every run directory holds files of the same name (empty
+    `done` marker and `namelist.config`) as well as a file without
+    checksum."""
+    left, right = [], []
+    later = 1_700_000_100.0
+    for e in range(6):
+        for r in range(4):
+            run = f"exp{e}/run{r}"
+            moved = f"moved/exp{e}/run{r}" if e == 1 else run
+            for f in range(8):
+                checksum = f"imohash:{1000 * e + 100 * r + f:032x}"
+                left.append((checksum, 10 + f, f"/pool/{run}/f{f}.nc"))
+                if e == 3 and r == 1:
+                    continue
+                if e == 2 and r == 0 and f < 3:
+                    checksum = f"imohash:{9000 + f:032x}"
+                    right.append((checksum, 10 + f, f"/other/{moved}/f{f}.nc", later))
+                elif e == 5 and r == 2 and f == 0:
+                    right.append((checksum, 10 + f, f"/other/{moved}/g{f}.nc"))
+                else:
+                    right.append((checksum, 10 + f, f"/other/{moved}/f{f}.nc"))
+            namelist = f"imohash:{100_000 + 10 * e + r:032x}"
+            left.append((namelist, 5, f"/pool/{run}/namelist.config"))
+            if r % 2:
+                namelist = f"imohash:{200_000 + 10 * e + r:032x}"
+            right.append((namelist, 5, f"/other/{moved}/namelist.config", later))
+            for rows, path in ((left, f"/pool/{run}"), (right, f"/other/{moved}")):
+                rows.append((EMPTY, 0, f"{path}/done"))
+                rows.append(("-", 7, f"{path}/log.txt"))
+    for f in range(5):
+        right.append((f"imohash:{50_000 + f:032x}", 3, f"/other/new/run0/g{f}.nc"))
+    return inventory("left.csv", left), inventory("right.csv", right)
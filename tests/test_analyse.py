@@ -0,0 +1,133 @@
+import pandas as pd
+import pytest
+
+from ptool import checksums
+from ptool import analyse
+from ptool.analyse import KEY, add_checksums, compare, merge, merge_names, read_csv
+
+from conftest import EMPTY
+
+
+def checksum(i):
+    return f"imohash:{i:032x}"
+
+
+def flags(results):
+    "compare results as dict of left file name -> flag"
+    return dict(zip(results.fname_left, results.index))
+
+
+def test_metadata_only_inventory(inventory):
+    rows = [("-", 10, "/pool/a/x.nc"), ("-", 20, "/pool/b/y.nc")]
+    df, _ = read_csv(inventory("meta.csv", rows))
+    assert not df.hashed.any()
+    assert df.algorithm == ""
+    assert add_checksums(df, df.algorithm).checksum.tolist() == ["-", "-"]
+
+
+def test_metadata_only_scan(make_tree, tmp_path):
+    pool = make_tree({"a/x.nc": "x", "b/y.nc": "yy"})
+    outfile = str(tmp_path / "meta.csv")
+    checksums.main(str(pool), outfile, metadata_only=True, profile="local")
+    df, _ = read_csv(outfile)
+    assert len(df) == 2
+    assert not df.hashed.any()
+
+
+def test_unhashed_files_never_match(inventory):
+    left = [
+        ("-", 10, "/pool/a/x.nc", 1_700_000_000),
+        ("-", 10, "/pool/a/w.nc"),
+        (checksum(1), 20, "/pool/a/y.nc"),
+    ]
+    right = [
+        ("-", 10, "/other/a/x.nc", 1_700_000_100),
+        ("-", 10, "/other/a/v.nc"),
+        (checksum(1), 20, "/other/a/y.nc"),
+    ]
+    left, _ = read_csv(inventory("left.csv", left))
+    right, _ = read_csv(inventory("right.csv", right))
+    assert flags(compare(left, right, threshold=0)) == {
+        "y.nc": "identical",
+        "x.nc": "modified_latest_right",
+        "w.nc": "unique",
+    }
+
+
+def test_empty_files_are_hashed(make_tree, tmp_path):
+    pool = make_tree({"a/empty.nc": "", "a/x.nc": "x"})
+    outfile = str(tmp_path / "pool.csv")
+    checksums.main(str(pool), outfile, profile="local")
+    df, _ = read_csv(outfile)
+    assert df.hashed.all()
+    df = add_checksums(df, df.algorithm).set_index("fname")
+    assert df.checksum["empty.nc"] == EMPTY
+
+
+def test_empty_files_are_compared_by_checksum(inventory):
+    left = [(EMPTY, 0, "/pool/a/empty.nc"), (checksum(1), 20, "/pool/a/x.nc")]
+    right = [(EMPTY, 0, "/other/a/empty.nc"), (checksum(1), 20, "/other/a/x.nc")]
+    left, _ = read_csv(inventory("left.csv", left))
+    right, _ = read_csv(inventory("right.csv", right))
+    results = compare(left, right, threshold=0)
+    assert flags(results) == {"empty.nc": "identical", "x.nc": "identical"}
+    rendered = add_checksums(results, left.algorithm, "_left")
+    assert EMPTY in rendered.checksum_left.tolist()
+
+
+def test_unique_empty_file_keeps_checksum(inventory):
+    left = [(EMPTY, 0, "/pool/a/empty.nc"), (checksum(1), 20, "/pool/a/x.nc")]
+    right = [(checksum(1), 20, "/other/a/x.nc"), (checksum(2), 30, "/other/a/z.nc")]
+    left, _ = read_csv(inventory("left.csv", left))
+    right, _ = read_csv(inventory("right.csv", right))
+    results = compare(left, right, threshold=0)
+    unique = add_checksums(results.loc[["unique"]], left.algorithm, "_left")
+    assert unique.checksum_left.tolist() == [EMPTY]
+    assert pd.isna(add_checksums(unique, right.algorithm, "_right").checksum_right).all()
+
+
+def test_parallel_merge_matches_serial(pools):
+    left, _ = read_csv(pools[0])
+    right, _ = read_csv(pools[1])
+    for on in (KEY, "fname"):
+        pd.testing.assert_frame_equal(
+            merge(left, right, on=on, workers=2), merge(left, right, on=on)
+        )
+
+
+def test_parallel_compare_matches_serial(pools):
+    left, _ = read_csv(pools[0])
+    right, _ = read_csv(pools[1])
+    serial = compare(left, right)
+    assert {"identical", "renamed", "modified_latest_right", "unique"} <= set(
+        serial.index
+    )
+    pd.testing.assert_frame_equal(compare(left, right, workers=3), serial)
+
+
+def test_parallel_bounded_name_join_matches_serial(pools, monkeypatch, capsys):
+    monkeypatch.setattr(analyse, "MAX_NAME_JOIN", 1000)
+    left, _ = read_csv(pools[0])
+    right, _ = read_csv(pools[1])
+    by_hash = merge(left, right)
+    serial = merge_names(left, right, by_hash)
+    assert "matched only within associated directories" in capsys.readouterr().err
+    pd.testing.assert_frame_equal(merge_names(left, right, by_hash, workers=2), serial)
+    pd.testing.assert_frame_equal(compare(left, right, workers=3), compare(left, right))
+
+
+def test_subtree_is_matched_below_prefix(inventory):
+    rows = [
+        (checksum(1), 10, "/pool/data/exp1/x.nc"),
+        (checksum(2), 10, "/pool/data/exp2/data/y.nc"),
+        (checksum(3), 10, "/pool/data/exp2/z.nc"),
+    ]
+    filename = inventory("pool.csv", rows)
+    df, _ = read_csv(filename, subtree="data")
+    assert df.fname.tolist() == ["y.nc"]
+    df, _ = read_csv(filename, subtree="exp2")
+    assert sorted(df.fname) == ["y.nc", "z.nc"]
+    with pytest.raises(ValueError, match="no files below pool/data"):
+        read_csv(filename, subtree="pool/data")
+    df, _ = read_csv(filename, subtree="/pool/data/exp1")
+    assert df.fname.tolist() == ["x.nc"]
@@ -0,0 +1,159 @@
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from ptool import checksums
+from ptool.analyse import hardlinks, read_csv
+
+from conftest import age, read_records
+
+
+def scan(path, outfile, cache_file, restat=True):
+    checksums.main(
+        str(path),
+        str(outfile),
+        cache_file=str(cache_file),
+        restat=restat,
+        profile="local",
+    )
+    return read_records(outfile)
+
+
+def tamper(cache_file, fpath, checksum="imohash:cached"):
+    "replaces the cached checksum of fpath, to tell cached from fresh records"
+    with open(cache_file) as fid:
+        data = json.load(fid)
+    data["files"][fpath][0] = checksum
+    with open(cache_file, "w") as fid:
+        json.dump(data, fid)
+
+
+def test_cache_reuses_unchanged_files(make_tree, tmp_path):
+    pool = make_tree({"a/x.nc": "x", "a/y.nc": "yy", "b/z.nc": "zzz"})
+    cache = tmp_path / "cache.json"
+    first = scan(pool, tmp_path / "1.csv", cache)
+    assert len(first) == 3
+    fpath = str(pool / "a/x.nc")
+    tamper(cache, fpath)
+    second = scan(pool, tmp_path / "2.csv", cache)
+    assert second[fpath] == ("imohash:cached", 1)
+
+
+def test_cache_rehashes_modified_file(make_tree, tmp_path):
+    pool = make_tree({"a/x.nc": "x", "a/y.nc": "yy"})
+    cache = tmp_path / "cache.json"
+    scan(pool, tmp_path / "1.csv", cache)
+    fpath = str(pool / "a/x.nc")
+    tamper(cache, fpath)
+    with open(fpath, "w") as fid:
+        fid.write("modified")
+    age(fpath, 7200)
+    records = scan(pool, tmp_path / "2.csv", cache)
+    assert records[fpath] == (checksums.hasher(fpath), len("modified"))
+
+
+def test_cache_relists_changed_directory(make_tree, tmp_path):
+    pool = make_tree({"a/x.nc": "x", "a/y.nc": "yy", "b/z.nc": "zzz"})
+    cache = tmp_path / "cache.json"
+    scan(pool, tmp_path / "1.csv", cache)
+    (pool / "a/new.nc").write_text("new")
+    os.remove(pool / "a/y.nc")
+    age(pool / "a/new.nc", 7200)
+    age(pool / "a", 7200)
+    records = scan(pool, tmp_path / "2.csv", cache)
+    assert sorted(records) == sorted(
+        str(pool / p) for p in ("a/x.nc", "a/new.nc", "b/z.nc")
+    )
+
+
+def test_no_restat_trusts_unchanged_directories(make_tree, tmp_path):
+    pool = make_tree({"a/x.nc": "x"})
+    cache = tmp_path / "cache.json"
+    scan(pool, tmp_path / "1.csv", cache)
+    fpath = str(pool / "a/x.nc")
+    tamper(cache, fpath)
+    # in-place modification does not change the mtime of the directory
+    with open(fpath, "w") as fid:
+        fid.write("modified")
+    age(fpath, 7200)
+    trusted = scan(pool, tmp_path / "2.csv", cache, restat=False)
+    assert trusted[fpath] == ("imohash:cached", 1)
+    records = scan(pool, tmp_path / "3.csv", cache)
+    assert records[fpath] == (checksums.hasher(fpath), len("modified"))
+
+
+def test_cache_checks_gathered_metadata(make_tree, tmp_path, monkeypatch):
+    pool = make_tree({"a/x.nc": "x", "a/y.nc": "yy"})
+    cache = tmp_path / "cache.json"
+    scan(pool, tmp_path / "1.csv", cache)
+    gathered = []
+    gather_metadata = checksums.gather_metadata
+
+    def spy(files, **kwargs):
+        gathered.extend(files)
+        return gather_metadata(files, **kwargs)
+
+    monkeypatch.setattr(checksums, "gather_metadata", spy)
+    stat = os.stat
+    stated = []
+
+    def counting_stat(path, *args, **kwargs):
+        stated.append(str(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    records = scan(pool, tmp_path / "2.csv", cache)
+    files = sorted(str(pool / p) for p in ("a/x.nc", "a/y.nc"))
+    assert sorted(records) == sorted(gathered) == files
+    # files are only stat'ed while gathering metadata
+    assert not set(stated) & set(files)
+
+
+@pytest.mark.parametrize("ext", [".gz", ".zst"])
+def test_compressed_snapshot_reads_back(make_tree, tmp_path, ext):
+    pool = make_tree({"a/x.nc": "x", "b/y.nc": "yy"})
+    outfile = str(tmp_path / f"pool.csv{ext}")
+    checksums.main(str(pool), outfile, profile="local")
+    with open(outfile, "rb") as fid:
+        assert fid.read(4) != checksums.HEADER[:4].encode()
+    records = read_records(outfile)
+    assert sorted(records) == [str(pool / "a/x.nc"), str(pool / "b/y.nc")]
+    df, _ = read_csv(outfile)
+    assert sorted(df.fname) == ["x.nc", "y.nc"]
+
+
+def test_compress_must_match_extension(make_tree, tmp_path):
+    pool = make_tree({"a/x.nc": "x"})
+    outfile = tmp_path / "plain.csv"
+    args = ["--compress", "gzip", "-o", str(outfile), str(pool)]
+    result = CliRunner().invoke(checksums.cli, args)
+    assert result.exit_code == 2
+    assert ".gz extension" in result.output
+    assert not outfile.exists()
+
+
+def test_hardlinks_are_hashed_once(make_tree, tmp_path, monkeypatch):
+    pool = make_tree({"a/x.nc": "x", "c/x.nc": "x", "a/y.nc": "yy"})
+    (pool / "b").mkdir()
+    os.link(pool / "a/x.nc", pool / "b/x.nc")
+    hashed = []
+    process_map = checksums.process_map
+
+    def spy(fn, files, **kwargs):
+        hashed.extend(files)
+        return process_map(fn, files, **kwargs)
+
+    monkeypatch.setattr(checksums, "process_map", spy)
+    outfile = str(tmp_path / "pool.csv")
+    checksums.main(str(pool), outfile, profile="local")
+    assert len(hashed) == 3
+    assert len(read_records(outfile)) == 4
+
+    df, dups = read_csv(outfile)
+    # three paths of x.nc, but only two copies of it
+    assert dups.fname.tolist() == ["x.nc"]
+    links = hardlinks(df)
+    assert links.fname.tolist() == ["x.nc"]
+    assert links.rparent.astype(str).tolist() in (["/a"], ["/b"])
@@ -0,0 +1,72 @@
+from click.testing import CliRunner
+
+from ptool.cli import cli
+
+
+def pools(inventory):
+    rows = [
+        (f"imohash:{i:032x}", 100 + i, f"/pool/exp{i % 4}/run{i % 3}/f{i}.nc")
+        for i in range(60)
+    ]
+    left = inventory("left.csv", rows)
+    right = inventory("right.csv", rows[:40] + rows[:10])
+    return left, right
+
+
+def test_sample_rejects_compact(inventory):
+    left, right = pools(inventory)
+    result = CliRunner().invoke(
+        cli, ["summary", "--sample", "0.5", "--compact", left, right]
+    )
+    assert result.exit_code == 2
+    assert "--compact" in result.output
+
+
+def test_sample_applies_drop_duplicates(inventory, monkeypatch):
+    from ptool import analyse
+
+    calls = []
+    read_csv = analyse.read_csv
+
+    def spy(*args, **kwargs):
+        calls.append(kwargs.get("drop_duplicates"))
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(analyse, "read_csv", spy)
+    left, right = pools(inventory)
+    args = ["--sample", "0.5", "--seed", "1", "--drop-duplicates", left, right]
+    result = CliRunner().invoke(cli, ["summary"] + args)
+    assert result.exit_code == 0, result.output
+    assert calls == [True, True]
+    assert "Estimated summary" in result.output
+
+
+def test_subtree_must_be_relative(inventory):
+    left, right = pools(inventory)
+    result = CliRunner().invoke(cli, ["compare", "--subtree", "/pool/exp1", left, right])
+    assert result.exit_code == 2
+    assert "relative" in result.output
+
+
+def test_subtree_without_files(inventory, tmp_path):
+    left, right = pools(inventory)
+    commands = [
+        ["compare"],
+        ["summary"],
+        ["summary", "--sample", "0.5"],
+        ["prepare-rsync", "-o", str(tmp_path / "sync.sh")],
+    ]
+    for command in commands:
+        args = command + ["--subtree", "exp9", left, right]
+        result = CliRunner().invoke(cli, args)
+        assert result.exit_code == 1, result.output
+        assert "Error: no files below exp9" in result.output
+
+
+def test_subtree_selects_directories_at_any_depth(inventory):
+    left, right = pools(inventory)
+    args = ["compare", "--fullpath", "--subtree", "exp1/", left, right]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "/pool/exp1/run" in result.output
+    assert "/pool/exp2/run" not in result.output
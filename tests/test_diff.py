@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+from ptool import diff
+
+EMPTY = "imohash:" + "0" * 32
+
+
+def changes(inventory, old, new, **kwargs):
+    outfile = inventory("changes.csv", [])
+    diff.main(inventory("old.csv", old), inventory("new.csv", new), outfile, **kwargs)
+    with open(outfile) as fid:
+        rows = csv.DictReader(fid)
+        return sorted((row["flag"], row["fpath_old"], row["fpath_new"]) for row in rows)
+
+
+def test_added_removed_modified_moved(inventory):
+    old = [
+        ("imohash:1", 1, "/p/a/kept.nc"),
+        ("imohash:2", 2, "/p/a/modified.nc"),
+        ("imohash:3", 3, "/p/a/moved.nc"),
+        ("imohash:4", 4, "/p/a/removed.nc"),
+    ]
+    new = [
+        ("imohash:1", 1, "/p/a/kept.nc"),
+        ("imohash:5", 2, "/p/a/modified.nc"),
+        ("imohash:6", 6, "/p/b/added.nc"),
+        ("imohash:3", 3, "/p/b/moved.nc"),
+    ]
+    assert changes(inventory, old, new) == [
+        ("added", "", "/p/b/added.nc"),
+        ("modified", "/p/a/modified.nc", "/p/a/modified.nc"),
+        ("moved", "/p/a/moved.nc", "/p/b/moved.nc"),
+        ("removed", "/p/a/removed.nc", ""),
+    ]
+
+
+def test_empty_files_are_not_moved(inventory):
+    old = [(EMPTY, 0, "/p/a/lock"), ("imohash:1", 1, "/p/a/x.nc")]
+    new = [("imohash:1", 1, "/p/a/x.nc"), (EMPTY, 0, "/p/b/done")]
+    assert changes(inventory, old, new) == [
+        ("added", "", "/p/b/done"),
+        ("removed", "/p/a/lock", ""),
+    ]
+
+
+def test_unsorted_input(inventory):
+    old = [("imohash:2", 2, "/p/b.nc"), ("imohash:1", 1, "/p/a.nc")]
+    new = [("imohash:1", 1, "/p/a.nc")]
+    with pytest.raises(ValueError, match="not sorted"):
+        changes(inventory, old, new)
+    assert changes(inventory, old, new, sort=True, buffer_lines=1) == [
+        ("removed", "/p/b.nc", "")
+    ]
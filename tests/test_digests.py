@@ -0,0 +1,42 @@
+from ptool.analyse import compare, read_csv
+from ptool.digests import directory_digests, load_digests, matching_subtrees
+
+from conftest import EMPTY
+
+COLUMNS = ["rparent_left", "fname_left", "flag", "rparent_right", "fname_right"]
+
+
+def associations(results):
+    "compare results as sorted records of (left file, flag, right file)"
+    df = results.reset_index()[COLUMNS].astype(str)
+    return sorted(map(tuple, df.values))
+
+
+def test_tree_matches_serial(pools):
+    left, _ = read_csv(pools[0])
+    right, _ = read_csv(pools[1])
+    assert associations(compare(left, right, tree=True)) == associations(
+        compare(left, right)
+    )
+
+
+def test_tree_keeps_paired_directories(inventory):
+    def checksum(i):
+        return f"imohash:{i:032x}"
+
+    left = [(checksum(f), 10, f"/pool/a/run0/f{f}.nc") for f in range(5)]
+    left += [(checksum(10 + f), 10, f"/pool/b/run0/f{f}.nc") for f in range(4)]
+    left += [(EMPTY, 0, "/pool/a/run0/done"), (EMPTY, 0, "/pool/b/run0/done")]
+    right = [(checksum(f), 10, f"/other/a/run0/f{f}.nc") for f in range(5)]
+    right += [(EMPTY, 0, "/other/a/run0/done")]
+    later = 1_700_000_100.0
+    right += [(checksum(20 + f), 10, f"/other/c/run0/f{f}.nc", later) for f in range(2)]
+    left, _ = read_csv(inventory("left.csv", left))
+    right, _ = read_csv(inventory("right.csv", right))
+    # empty files have a checksum, their directories a digest
+    assert directory_digests(left).known.all()
+    assert matching_subtrees(load_digests(left), load_digests(right)) == {"/a": "/a"}
+    results = compare(left, right, tree=True)
+    assert associations(results) == associations(compare(left, right))
+    b = results[results.rparent_left == "/b/run0"]
+    assert set(b.index) == {"unique"}
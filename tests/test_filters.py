@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from ptool.analyse import read_csv
+from ptool.checksums import get_files
+from ptool.filters import Filter, make_filter, split
+
+
+def test_split_escapes_separator():
+    assert split("a,b\\,c,d") == ["a", "b,c", "d"]
+    assert split("a|b#|c|d", sep="|", escape="#") == ["a", "b|c", "d"]
+    assert split(None) == []
+
+
+def test_empty_filter_is_false():
+    assert not Filter.parse(None)
+    assert not Filter.parse("")
+    assert Filter.parse("*.tmp")
+
+
+def test_name_and_path_globs():
+    f = Filter.parse("*.tmp,**/restart/*.nc,exp1/out")
+    assert f.excludes_file("a/b/x.tmp")
+    assert f.excludes_file("exp/restart/x.nc")
+    assert f.excludes_file("restart/x.nc")
+    assert not f.excludes_file("exp/restart/sub/x.nc")
+    assert not f.excludes_file("exp/output/x.nc")
+    assert f.excludes_dir("exp1/out")
+    assert not f.excludes_dir("exp2/exp1/out")
+
+
+def test_wildcards_do_not_cross_directories():
+    f = Filter.parse("exp*/x.nc")
+    assert f.excludes_file("exp1/x.nc")
+    assert not f.excludes_file("exp1/sub/x.nc")
+
+
+def test_literal_patterns():
+    f = Filter.parse("[x].nc")
+    assert f.excludes_file("a/x.nc")
+    assert not f.excludes_file("a/[x].nc")
+    f = Filter.parse("a+b.nc")
+    assert f.excludes_file("a+b.nc")
+    assert not f.excludes_file("aab.nc")
+
+
+def test_kind_prefixes():
+    f = Filter.parse("file:*.log,dir:dist_*")
+    assert f.excludes_file("x/run.log")
+    assert not f.excludes_dir("x/run.log")
+    assert f.excludes_dir("x/dist_1")
+    assert not f.excludes_file("x/dist_1")
+    assert f.excludes_tree("x/dist_1/sub")
+
+
+def test_legacy_ignore_patterns():
+    f = make_filter("size>1k", ignore="*.tmp", ignore_dirs=".git")
+    assert f.excludes_file("a.tmp")
+    assert not f.excludes_dir("a.tmp")
+    assert f.excludes_dir("x/.git")
+
+
+@pytest.mark.parametrize(
+    "rule, fsize, excluded",
+    [
+        ("size>10G", 10 * 2**30 + 1, True),
+        ("size>10G", 10 * 2**30, False),
+        ("size<=1.5k", 1536, True),
+        ("size>=2MiB", 2 * 2**20, True),
+        ("size=0", 0, True),
+        ("size=0", 1, False),
+    ],
+)
+def test_size_predicates(rule, fsize, excluded):
+    (field, op, value), = Filter.parse(rule).predicates
+    assert field == "size"
+    assert op(fsize, value) is excluded
+
+
+def test_time_predicates():
+    now = time.time()
+    (field, op, value), = Filter.parse("age>30d").predicates
+    assert field == "mtime"
+    assert op(now - 31 * 86400, value)
+    assert not op(now - 29 * 86400, value)
+    (field, op, value), = Filter.parse("mtime<2020-01-01").predicates
+    assert op(1_500_000_000, value)
+    assert not op(1_700_000_000, value)
+
+
+@pytest.mark.parametrize("rule", ["size>10X", "age>3y", "mtime<yesterday"])
+def test_invalid_predicates(rule):
+    with pytest.raises(ValueError):
+        Filter.parse(rule)
+
+
+def test_scanner_and_loader_agree(make_tree, inventory):
+    files = {
+        "exp1/out/a.nc": "a",
+        "exp1/restart/b.nc": "b",
+        "exp1/run.log": "log",
+        "exp2/dist_1/c.nc": "c",
+        "exp2/d.nc": "d" * 2048,
+    }
+    pool = make_tree(files)
+    expression = "**/restart/*.nc,file:*.log,dir:dist_*,size>1k"
+    scanned = sorted(get_files(str(pool), exclude=expression))
+    rows = [
+        (f"imohash:{i:032x}", len(content), str(pool / relpath))
+        for i, (relpath, content) in enumerate(files.items(), 1)
+    ]
+    df, _ = read_csv(inventory("pool.csv", rows), exclude=expression)
+    loaded = sorted(df.prefix + df.rparent.astype(str).str.rstrip("/") + "/" + df.fname)
+    assert scanned == loaded == [str(pool / "exp1/out/a.nc")]
@@ -0,0 +1,107 @@
+import numpy as np
+from click.testing import CliRunner
+
+from ptool.analyse import read_csv
+from ptool.cli import cli
+from ptool.sketch import BloomFilter, Sketch, is_sketch, unique_files
+from ptool.verify import read_manifest
+
+from conftest import EMPTY
+
+
+def snapshots(inventory):
+    left = [
+        ("imohash:1", 1, "/pool/a/x.nc"),
+        ("imohash:2", 2, "/pool/a/y.nc"),
+        (EMPTY, 0, "/pool/b/empty.nc"),
+        ("-", 3, "/pool/b/meta.nc"),
+    ]
+    right = [("imohash:1", 1, "/other/a/x.nc"), ("imohash:3", 3, "/other/c/z.nc")]
+    left, _ = read_csv(inventory("left.csv", left))
+    right, _ = read_csv(inventory("right.csv", right))
+    return left, right
+
+
+def test_lookup_flags(inventory, tmp_path):
+    left, right = snapshots(inventory)
+    path = str(tmp_path / "right.sketch")
+    Sketch.from_snapshot(right).save(path)
+    assert is_sketch(path)
+    sketch = Sketch.load(path)
+    assert sketch.files == 2
+    flags = dict(zip(left.fname, sketch.lookup(left).flag))
+    assert flags == {
+        "x.nc": "present",
+        "y.nc": "missing",
+        "empty.nc": "missing",
+        "meta.nc": "unchecked",
+    }
+
+
+def test_empty_files_are_sketched(inventory):
+    left, right = snapshots(inventory)
+    sketch = Sketch.from_snapshot(left, per_directory=True)
+    assert sketch.files == 3
+    assert dict(zip(right.fname, sketch.lookup(right).flag))["x.nc"] == "present"
+    assert sorted(sketch.filters) == ["a", "b"]
+
+
+def test_unique_files_include_empty_files(inventory):
+    left, right = snapshots(inventory)
+    unique = unique_files(left, Sketch.from_snapshot(right))
+    assert sorted(unique.fname_left) == ["empty.nc", "y.nc"]
+    assert unique.hashed_left.all()
+
+
+def test_prepare_rsync_transfers_empty_files(inventory, tmp_path):
+    left, right = snapshots(inventory)
+    sketch = str(tmp_path / "right.sketch")
+    Sketch.from_snapshot(right).save(sketch)
+    manifest = str(tmp_path / "manifest.csv")
+    args = ["-o", str(tmp_path / "sync.sh"), "-m", manifest, left.filename, sketch]
+    result = CliRunner().invoke(cli, ["prepare-rsync"] + args)
+    assert result.exit_code == 0, result.output
+    entries = read_manifest(manifest)
+    assert entries["/other/b/empty.nc"] == (EMPTY, 0, "/pool/b/empty.nc")
+    assert sorted(entries) == ["/other/a/y.nc", "/other/b/empty.nc"]
+
+
+def test_no_false_negatives():
+    rng = np.random.default_rng(0)
+    key_hi, key_lo = rng.integers(0, 2**63, size=(2, 10_000), dtype=np.uint64)
+    bloom = BloomFilter.for_capacity(len(key_lo), fpr=0.01)
+    bloom.add(key_hi, key_lo)
+    assert bloom.contains(key_hi, key_lo).all()
+    other_hi, other_lo = rng.integers(0, 2**63, size=(2, 10_000), dtype=np.uint64)
+    assert bloom.contains(other_hi, other_lo).mean() < 0.02
+
+
+def test_options_ignored_by_sketches_are_rejected(inventory, tmp_path):
+    left, right = snapshots(inventory)
+    sketch = str(tmp_path / "right.sketch")
+    Sketch.from_snapshot(right).save(sketch)
+    outfile = str(tmp_path / "sync.sh")
+    manifest = str(tmp_path / "manifest.csv")
+    rejected = [
+        ["summary", "--sample", "0.5"],
+        ["summary", "--tree"],
+        ["summary", "-j", "2"],
+        ["summary", "--compact"],
+        ["summary", "--drop-duplicates"],
+        ["summary", "--threshold", "0.5"],
+        ["prepare-rsync", "-o", outfile, "--flags", "modified"],
+        ["prepare-rsync", "-o", outfile, "--flags", "both"],
+        ["prepare-rsync", "-o", outfile, "--tree"],
+        ["prepare-rsync", "-o", outfile, "--workers", "2"],
+    ]
+    for args in rejected:
+        result = CliRunner().invoke(cli, args + [left.filename, sketch])
+        assert result.exit_code == 2, (args, result.output)
+        assert "RIGHT is a sketch" in result.output
+    accepted = [
+        ["summary"],
+        ["prepare-rsync", "-o", outfile, "-m", manifest, "--flags", "unique"],
+    ]
+    for args in accepted:
+        result = CliRunner().invoke(cli, args + [left.filename, sketch])
+        assert result.exit_code == 0, (args, result.output)
@@ -0,0 +1,76 @@
+import gzip
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from ptool import utils
+from ptool.checksums import cli as checksums_cli
+from ptool.utils import site_profile
+
+CONFIG = {
+    "defaults": {
+        "profile": {
+            "checksums": {"workers": None, "chunksize": 10, "exclude": None}
+        }
+    },
+    "testsite": {
+        "node_names": {"login": "^nosuchhost$"},
+        "profile": {
+            "checksums": {"chunksize": 50, "exclude": "*.tmp", "compression": "zstd"}
+        },
+    },
+}
+
+
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setattr(utils, "load_config", lambda config_path=None: CONFIG)
+
+
+def test_machine_profile_overrides_defaults(config):
+    site, settings = site_profile("checksums", computer="testsite")
+    assert site == "testsite"
+    assert settings == {
+        "workers": None,
+        "chunksize": 50,
+        "exclude": "*.tmp",
+        "compression": "zstd",
+    }
+
+
+def test_local_profile_uses_defaults(config):
+    assert site_profile("checksums", computer="local") == (
+        "local",
+        {"workers": None, "chunksize": 10, "exclude": None},
+    )
+
+
+@pytest.mark.parametrize("name", ["nosuchsite", "defaults"])
+def test_unknown_profile_is_rejected(config, name):
+    with pytest.raises(click.BadParameter, match="local, testsite"):
+        site_profile("checksums", computer=name)
+
+
+def test_unknown_profile_on_the_command_line(make_tree):
+    pool = make_tree({"a/x.nc": "x"})
+    result = CliRunner().invoke(checksums_cli, ["--profile", "nosuchsite", str(pool)])
+    assert result.exit_code == 2
+    assert "unknown site profile 'nosuchsite'" in result.output
+
+
+def test_options_override_profile(config, make_tree):
+    pool = make_tree({"a/x.nc": "x", "a/y.tmp": "y", "a/z.log": "z"})
+    args = ["--profile", "testsite", str(pool)]
+    # the profile compresses stdout with zstd and excludes *.tmp
+    result = CliRunner().invoke(checksums_cli, args)
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes.startswith(b"\x28\xb5\x2f\xfd")
+    # --compress wins over the profile, --exclude adds to its rules
+    args = ["--compress", "gzip", "--exclude", "*.log"] + args
+    result = CliRunner().invoke(checksums_cli, args)
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes.startswith(b"\x1f\x8b")
+    text = gzip.decompress(result.stdout_bytes).decode()
+    assert "x.nc" in text
+    assert "y.tmp" not in text and "z.log" not in text
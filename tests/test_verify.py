@@ -0,0 +1,80 @@
+import csv
+
+from click.testing import CliRunner
+
+from ptool import verify
+from ptool.checksums import hasher
+from ptool.cli import cli
+
+
+def transfer(make_tree, tmp_path):
+    "destination pool and manifest with one file for each kind of failure"
+    dst = make_tree(
+        {
+            "ok.nc": "data",
+            "unchecked.nc": "data",
+            "size.nc": "truncated",
+            "checksum.nc": "corrupt!",
+            "empty.nc": "",
+        },
+        root="dst",
+    )
+    expected = {
+        "ok.nc": (hasher(str(dst / "ok.nc")), 4),
+        "unchecked.nc": ("-", 4),
+        "size.nc": ("imohash:1", 100),
+        "checksum.nc": (hasher(str(dst / "ok.nc")), 8),
+        "empty.nc": (hasher(str(dst / "empty.nc")), 0),
+        "missing.nc": ("imohash:2", 3),
+    }
+    rows = [
+        (checksum, fsize, f"/src/{name}", str(dst / name))
+        for name, (checksum, fsize) in expected.items()
+    ]
+    manifest = str(tmp_path / "manifest.csv")
+    verify.write_manifest(manifest, rows)
+    return dst, manifest
+
+
+def test_manifest_roundtrip(make_tree, tmp_path):
+    dst, manifest = transfer(make_tree, tmp_path)
+    entries = verify.read_manifest(manifest)
+    assert entries[str(dst / "unchecked.nc")] == ("-", 4, "/src/unchecked.nc")
+    assert len(entries) == 6
+
+
+def test_verify_reports_failures(make_tree, tmp_path):
+    dst, manifest = transfer(make_tree, tmp_path)
+    outfile = str(tmp_path / "failures.csv")
+    counts = verify.main(manifest, outfile=outfile, profile="local")
+    assert counts == {
+        "missing": 1,
+        "size": 1,
+        "checksum": 1,
+        "unreadable": 0,
+        "verified": 3,
+    }
+    with open(outfile) as fid:
+        failures = {row["dst"]: row for row in csv.DictReader(fid)}
+    assert failures[str(dst / "missing.nc")]["flag"] == "missing"
+    assert failures[str(dst / "size.nc")]["fsize_actual"] == "9"
+    row = failures[str(dst / "checksum.nc")]
+    assert row["flag"] == "checksum"
+    assert row["src"] == "/src/checksum.nc"
+    assert row["checksum_actual"] == hasher(str(dst / "checksum.nc"))
+
+
+def test_verify_transfer_exit_status(make_tree, tmp_path):
+    _, manifest = transfer(make_tree, tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(cli, ["verify-transfer", "--profile", "local", manifest])
+    assert result.exit_code == 1
+    entries = verify.read_manifest(manifest)
+    rows = [
+        (checksum, fsize, src, dst_path)
+        for dst_path, (checksum, fsize, src) in entries.items()
+        if dst_path.endswith(("ok.nc", "unchecked.nc", "empty.nc"))
+    ]
+    verify.write_manifest(manifest, rows)
+    result = runner.invoke(cli, ["verify-transfer", "--profile", "local", manifest])
+    assert result.exit_code == 0, result.output